@@ -1,15 +1,15 @@
+import asyncio
 from datetime import datetime
 from multiprocessing import Process, Queue
 import os
 import sys
-import struct
-from threading import Thread, RLock
-import time
+from threading import RLock
 import types
 
 import numpy as np
 
-from PySide6.QtCore import QByteArray, QFile, QIODevice, QPointF, Signal, Slot
+from PySide6.QtCore import QFile, QIODevice, QTimer, Signal, Slot
+from PySide6.QtNetwork import QTcpSocket
 from PySide6.QtGui import QColor, QFont, QPainter, QPen
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtWidgets import QApplication, QWidget
@@ -29,7 +29,50 @@ from PySide6.QtBluetooth import \
     QBluetoothServiceDiscoveryAgent, \
     QBluetoothServiceInfo
 
-import design
+from buffer import RingBuffer
+from decoder import SampleDecoder
+from feature import Spectrum, SpectrumAverage
+from pipeline import FanOut, consume, mergeBlocks, queueItems, ringBlocks, runWithQt
+import profiling
+from recognition import recognitionProcess
+from recorder import Recorder
+from render import decimateMinMax, fillSeries, plotColumns
+from transport import SharedRing
+
+
+# Sampling rate of the device, see TIMER_FREQ in server.c.
+SAMPLING_RATE = 1000
+# host:port of a simulator.py device to connect to instead of a Bluetooth one.
+SIMULATED_DEVICE = os.environ.get('SEMG_DEVICE', '')
+# Channels sent in every frame, see SEND_CHANNEL_DATA in server.c (up to 6).
+# The model must be trained for the same number of channels.
+CHANNEL_COUNT = 2
+# A .npz exported by compiled.py runs without sklearn.
+MODEL_PATH = 'models/1s_model.pkl'
+# Threads extracting the features of the channels in parallel, 1 extracts
+# them sequentially. Only raise it (up to min(CHANNEL_COUNT, os.cpu_count()))
+# after `python benchmark.py channels` shows the pool is faster on the machine,
+# on one core it is slower at every channel count.
+FEATURE_WORKERS = 1
+# Keep the latest 10 minutes of samples in the Bluetooth and visual clients.
+HISTORY_CAPACITY = 600 * SAMPLING_RATE
+# Keep a few recognition windows in the recognition client.
+RECOGNITION_CAPACITY = 4000
+# Shared signal ring between the processes, a consumer that falls more than
+# 10 seconds behind loses its oldest samples.
+RING_CAPACITY = 10 * SAMPLING_RATE
+# Flush the complete recording to disk at this interval (seconds).
+RECORD_FLUSH_INTERVAL = 1.0
+# Classify at most once every 100 new samples (10 times per second).
+RECOGNITION_STRIDE = 100
+# Redraw the charts at most this many times per second.
+RENDER_FPS = 30
+# Samples shown in the time domain charts and transformed for the frequency domain charts.
+CHART_WINDOW = 1000
+# Spectrum charts: taper of every frame, and averaging across frames
+# ('exponential', 'welch' or None), see feature.SpectrumAverage.
+SPECTRUM_WINDOW = 'hann'
+SPECTRUM_AVERAGING = 'exponential'
 
 
 def loadUI(ui_file_name):
@@ -48,10 +91,10 @@ def loadUI(ui_file_name):
 
 class BluetoothClient(QWidget):
 
-    def __init__(self, comm_qs):
+    def __init__(self, signal_ring):
         super().__init__()
 
-        self.comm_qs = comm_qs
+        self.signal_ring = signal_ring
 
         self.ui = loadUI('BluetoothClient.ui')
         self.setLayout(self.ui.mainPanel)
@@ -79,12 +122,16 @@ class BluetoothClient(QWidget):
         # The connection error can be shown only if this field is False.
         self.is_connection_stopped_by_user = False
 
-        # Store the single byte data temporarily to make a 16-bit uint later.
-        self.half_data_array = QByteArray()
-        # Maintain a backend list to store all received signal sampling data.
-        self.sampling_value_list = list()
+        # Decode the byte stream into multi-channel voltage blocks, the bytes of
+        # an incomplete frame are kept by the decoder until the next reading.
+        self.decoder = SampleDecoder(CHANNEL_COUNT)
+        # Maintain a backend ring buffer to store the latest received signal data.
+        self.signal_buffer = RingBuffer(CHANNEL_COUNT, HISTORY_CAPACITY, np.float32)
 
-        self.device_agent.start()
+        if SIMULATED_DEVICE:
+            self.ui.deviceList.insertItem(0, f'simulator @ {SIMULATED_DEVICE}')
+        else:
+            self.device_agent.start()
 
     def closeEvent(self, _):
         try:
@@ -93,6 +140,10 @@ class BluetoothClient(QWidget):
             self.socket.readAll()
         except Exception as _:
             pass
+        self.signal_ring.close()
+        self.signal_ring.unlink()
+        # os._exit skips the atexit handler, the decode timings are recorded only here.
+        profiling.dump()
         os._exit(0) # Use this to terminate all threads.
 
     @Slot(QBluetoothDeviceInfo)
@@ -107,6 +158,9 @@ class BluetoothClient(QWidget):
         try:
             self.ui.startButton.setEnabled(False)
             self.ui.stateIndicator.setText('正在连接')
+            if SIMULATED_DEVICE:
+                self.startSimulatedConnection()
+                return
             # Try to pair with the target device.
             name_addr = self.ui.deviceList.currentText().split(' @ ')
             if len(name_addr) == 2:
@@ -115,6 +169,17 @@ class BluetoothClient(QWidget):
         except Exception as e:
             print(f'Exception in startConnection, {e}')
 
+    # The simulator speaks the same protocol over TCP, so the socket is used
+    # just like the Bluetooth one once connected.
+    def startSimulatedConnection(self):
+        host, port = SIMULATED_DEVICE.rsplit(':', 1)
+        self.is_connection_stopped_by_user = False
+        self.socket = QTcpSocket()
+        self.socket.connected.connect(self.requestDone)
+        self.socket.errorOccurred.connect(self.requestFailed)
+        self.socket.readyRead.connect(self.readDeviceData)
+        self.socket.connectToHost(host, int(port))
+
     @Slot()
     def stopConnection(self):
         try:
@@ -122,6 +187,11 @@ class BluetoothClient(QWidget):
             self.socket.write(b'\x02')
             self.socket.readAll()
             self.is_connection_stopped_by_user = True
+            if SIMULATED_DEVICE:
+                self.socket.disconnectFromHost()
+                self.ui.startButton.setEnabled(True)
+                self.ui.stateIndicator.setText('无连接')
+                return
             name_addr = self.ui.deviceList.currentText().split(' @ ')
             if len(name_addr) == 2:
                 addr = name_addr[1]
@@ -181,40 +251,33 @@ class BluetoothClient(QWidget):
         if not self.is_connection_stopped_by_user:
             self.ui.stateIndicator.setText('连接请求服务失败')
 
-    def broadcastReceive(self, data):
-        for q in self.comm_qs.values():
-            q.put(data)
+    def broadcastReceive(self, data, acquired_at):
+        self.signal_ring.write(data, acquired_at)
 
     @Slot()
     def readDeviceData(self):
         try:
-            data_array = self.socket.read(1024)
-            # Check whether there are bytes remained in the previous reading.
-            # Complete current received byte array with those bytes (if have).
-            if len(self.half_data_array) > 0:
-                data_array.push_front(self.half_data_array.data())
-                self.half_data_array.clear()
-            # Store the trailing bytes temporarily to handle in the next reading.
-            if len(data_array) % 2 == 1:
-                # Use operator[] instead of at() here since the latter decodes utf-8.
-                self.half_data_array.append(data_array[len(data_array) - 1])
-                data_array.remove(len(data_array) - 1, 1)
-            # Convert byte array to 16-bit unsigned integer array (sampling values).
-            if len(data_array) > 0:
-                value_array = list(struct.unpack('H' * int(len(data_array) // 2), data_array.data()))
-                self.sampling_value_list = self.sampling_value_list + value_array
-                self.broadcastReceive(value_array) # Notify all registered processes.
+            acquired_at = profiling.now()
+            # Take everything available, readyRead is not emitted again for
+            # bytes left in the socket buffer.
+            data_array = self.socket.readAll()
+            # Convert byte array to (channels, n) referenced voltage values.
+            signal_block = self.decoder.decode(data_array.data())
+            profiling.since('decode', acquired_at)
+            profiling.count('bytes_received', len(data_array))
+            if signal_block.shape[1] > 0:
+                self.signal_buffer.append(signal_block)
+                self.broadcastReceive(signal_block, acquired_at) # Notify all registered processes.
         except Exception as e:
             print(f'Exception in readDeviceData, {e}')
  
 
 class VisualClient(QWidget):
 
-    def __init__(self, comm_queue, notify_queue, callback_queue):
+    def __init__(self, signal_ring, notify_queue, callback_queue):
         super().__init__()
 
-        self.channel_index = 0
-        self.comm_queue = comm_queue
+        self.signal_reader = signal_ring.reader()
         self.notify_queue = notify_queue
         self.callback_queue = callback_queue
 
@@ -224,32 +287,45 @@ class VisualClient(QWidget):
         self.setWindowTitle('表面肌电手势识别 - 可视化客户端')
 
         self.ui.channel = types.SimpleNamespace()
-        self.ui.channel.t = [self.makeTimeDomainChart('通道 ' + str(i)) for i in range(1, 3)]
-        self.ui.channel.f = [self.makeFreqDomainChart('通道 ' + str(i)) for i in range(1, 3)]
-        # Support visualizing 2-channel data dynamically.
-        self.ui.signalGallery.addWidget(self.ui.channel.t[0].chartView, 0, 0)
-        self.ui.signalGallery.addWidget(self.ui.channel.t[1].chartView, 0, 1)
-        self.ui.signalGallery.addWidget(self.ui.channel.f[0].chartView, 1, 0)
-        self.ui.signalGallery.addWidget(self.ui.channel.f[1].chartView, 1, 1)
+        self.ui.channel.t = [self.makeTimeDomainChart('通道 ' + str(i)) for i in range(1, CHANNEL_COUNT + 1)]
+        self.ui.channel.f = [self.makeFreqDomainChart('通道 ' + str(i)) for i in range(1, CHANNEL_COUNT + 1)]
+        # Support visualizing multi-channel data dynamically, one column per channel.
+        for i in range(0, CHANNEL_COUNT):
+            self.ui.signalGallery.addWidget(self.ui.channel.t[i].chartView, 0, i)
+            self.ui.signalGallery.addWidget(self.ui.channel.f[i].chartView, 1, i)
 
         self.ui.startButton.clicked.connect(self.startCollect)
         self.ui.stopButton.clicked.connect(self.stopCollect)
 
-        self.signal_amplitude_list = [list() for i in range(0, 2)]
+        self.signal_buffer = RingBuffer(CHANNEL_COUNT, HISTORY_CAPACITY, np.float32)
+        # Stream all received data into the complete recording of this session.
+        complete_dir = 'export/complete/' + self.dateTimeNowStr()
+        if not os.path.exists(complete_dir):
+            os.makedirs(complete_dir)
+        self.recorder = Recorder(complete_dir + '/recording.semg', CHANNEL_COUNT, SAMPLING_RATE,
+                                 flush_interval=RECORD_FLUSH_INTERVAL)
 
         self.lk = RLock()
 
-        self.td1 = Thread(target=VisualClient.peekCommQueue, args=(self,))
-        self.td1.daemon = True
-        self.td1.start()
-
-        self.td2 = Thread(target=VisualClient.peekCallbackQueue, args=(self,))
-        self.td2.daemon = True
-        self.td2.start()
+        # Redraw on a fixed frame rate instead of once per received block,
+        # skipping the frames without new data.
+        self.rendered_total = 0
+        self.chart_x = np.arange(0, CHART_WINDOW + 1, dtype=np.float64)
+        self.recent_data = np.zeros((CHANNEL_COUNT, CHART_WINDOW + 1), np.float32)
+        # Real-valued spectrum of the latest window, the same transform as the frequency features.
+        self.spectrum = SpectrumAverage(Spectrum(SAMPLING_RATE, window=SPECTRUM_WINDOW, detrend=True),
+                                        SPECTRUM_AVERAGING)
+        self.freq_x = self.spectrum.spectrum.frequencies(CHART_WINDOW)
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.updateChart)
+        self.render_timer.start(1000 // RENDER_FPS)
+
+        self.result_received.connect(self.updateResult)
 
     def closeEvent(self, _):
-        self.exportCompleteData()
+        self.recorder.close()
         self.notify_queue.put('CLOSE')
+        profiling.dump()
         os._exit(0) # Use this to terminate all threads.
 
     def dateTimeNowStr(self):
@@ -259,7 +335,7 @@ class VisualClient(QWidget):
         return self.makeGeneralChart(title, '时间', (0, 1000), 6, '幅度 / 伏特', (0, 3.3), 2)
 
     def makeFreqDomainChart(self, title):
-        return self.makeGeneralChart(title, '频率', (-500, 500), 6, '幅度 / 绝对值', (0, 1000), 2)
+        return self.makeGeneralChart(title, '频率', (0, SAMPLING_RATE // 2), 6, '幅度 / 绝对值', (0, 1000), 2)
 
     def makeGeneralChart(self, title, xlabel, xrange, xtick, ylabel, yrange, ytick):
         chart = types.SimpleNamespace()
@@ -268,7 +344,7 @@ class VisualClient(QWidget):
         chart.series.setName('肌电信号')
         chart.series.setUseOpenGL(True)
         chart.series.setPen(QPen(QColor(65, 105, 225), 1))
-        chart.series.replace([QPointF(x, 0) for x in range(0, 1001)])
+        fillSeries(chart.series, np.arange(xrange[0], xrange[1] + 1), np.zeros(xrange[1] - xrange[0] + 1))
 
         chart.axisX = QValueAxis()
         chart.axisX.setRange(*xrange)
@@ -301,274 +377,146 @@ class VisualClient(QWidget):
     def startCollect(self):
         self.ui.startButton.setEnabled(False)
         self.ui.stopButton.setEnabled(True)
-        self.collect_start = [len(self.signal_amplitude_list[i]) for i in range(0, 2)]
+        self.collect_start = self.signal_buffer.total
         self.ui.infoLabel.setText('正在收集......')
 
     @Slot()
     def stopCollect(self):
-        self.collect_stop = [len(self.signal_amplitude_list[i]) for i in range(0, 2)]
+        self.collect_stop = self.signal_buffer.total
         info_text = str()
-        for i in range(0, 2):
+        for i in range(0, CHANNEL_COUNT):
             if i != 0:
                 info_text = info_text + ', '
             info_text = info_text + '通道 ' + str(i + 1) + ' ( '
-            info_text = info_text + str(self.collect_stop[i] - self.collect_start[i]) + ' 点 )'
+            info_text = info_text + str(self.collect_stop - self.collect_start) + ' 点 )'
         self.ui.infoLabel.setText(info_text)
         self.exportSliceData()
         self.ui.startButton.setEnabled(True)
         self.ui.stopButton.setEnabled(False)
 
     def exportSliceData(self):
-        for i in range(0, 2):
-            signal_len = len(self.signal_amplitude_list[i])
-            a = min(self.collect_start[i], signal_len - 1)
-            b = max(min(self.collect_stop[i], signal_len), a + 1)
-            src_data = self.signal_amplitude_list[i][a:b]
-            # Append 2-channel offline signal data.
+        self.lk.acquire()
+        signal_len = self.signal_buffer.total
+        a = min(self.collect_start, signal_len - 1)
+        b = max(min(self.collect_stop, signal_len), a + 1)
+        slice_data = self.signal_buffer.range(a, b).copy()
+        self.lk.release()
+        for i in range(0, CHANNEL_COUNT):
+            src_data = slice_data[i]
+            # Append multi-channel offline signal data.
             offline_dir = 'export/slices/' + self.dateTimeNowStr()
             if not os.path.exists(offline_dir):
                 os.makedirs(offline_dir)
             np.save(offline_dir + '/channel' + str(i + 1) + '.npy', src_data)
-            # Overwrite 2-channel runtime signal data.
+            # Overwrite multi-channel runtime signal data.
             runtime_dir = 'export/runtime'
             if not os.path.exists(runtime_dir):
                 os.mkdir(runtime_dir)
             np.save(runtime_dir + '/channel' + str(i + 1) + '.npy', src_data)
 
-    data_received = Signal()
-
-    def peekCommQueue(self):
+    # Wake up only when the Bluetooth client publishes signal data or the
+    # recognition client a result. The signal blocks waiting to be stored are
+    # merged, and only the latest waiting result is shown.
+    async def pipeline(self):
+        signals = FanOut()
+        stored = signals.subscribe(policy='coalesce', merge=mergeBlocks(HISTORY_CAPACITY))
+        results = FanOut()
+        shown = results.subscribe(policy='latest')
+        await asyncio.gather(
+            signals.pump(ringBlocks(self.signal_reader)),
+            consume(stored, self.storeSignalBlock),
+            results.pump(queueItems(self.callback_queue)),
+            # Signals are queued to the Qt thread, whichever thread runs the loop.
+            consume(shown, lambda result: self.result_received.emit(*result)),
+        )
+
+    def storeSignalBlock(self, signal_block):
         try:
-            self.data_received.connect(self.updateChart)
-            while True:
-                self.lk.acquire()
-                while not self.comm_queue.empty():
-                    # Throw if the queue blocks more than 1 second.
-                    data_array = self.comm_queue.get(True, 1)
-                    # Convert 16-bit sampling values to referenced voltage values.
-                    for i in range(0, len(data_array)):
-                        data_array[i] = (data_array[i] / 65536) * 3.3
-                        self.signal_amplitude_list[self.channel_index].append(data_array[i])
-                        self.channel_index = (self.channel_index + 1) % 2
-                    # Notify to update the chart with new data.
-                    self.data_received.emit()
-                self.lk.release()
-                # Prevnet the UI thread from getting stuck.
-                time.sleep(0.01)
+            self.lk.acquire()
+            self.signal_buffer.append(signal_block)
+            self.lk.release()
+            # Outside the lock, the chart update must not wait for the recording.
+            if not self.recorder.closed:
+                self.recorder.write(signal_block)
         except Exception as e:
-            print(f'Exception in peekCommQueue, {e}')
+            print(f'Exception in storeSignalBlock, {e}')
 
     @Slot()
     def updateChart(self):
         try:
             self.lk.acquire()
-            self.updateTimeDomainChart()
-            self.updateFreqDomainChart()
+            if self.signal_buffer.total == self.rendered_total:
+                self.lk.release()
+                return
+            self.rendered_total = self.signal_buffer.total
+            # Latest samples of all channels, zero-padded on the left before the window fills up.
+            recent_data = self.recent_data
+            available = self.signal_buffer.last(CHART_WINDOW + 1)
+            recent_data[:, recent_data.shape[1] - available.shape[1]:] = available
             self.lk.release()
+            with profiling.timed('chart_update'):
+                self.updateTimeDomainChart(recent_data)
+                self.updateFreqDomainChart(recent_data[:, 1:])
         except Exception as e:
             print(f'Exception in updateChart, {e}')
 
-    def updateTimeDomainChart(self):
-        for i in range(0, 2):
-            point_vec = self.ui.channel.t[i].series.pointsVector()
-            pvec_len = len(point_vec)
-            svec_len = len(self.signal_amplitude_list[i])
-            mvec_len = min(pvec_len, svec_len)
-            for j in range(0, mvec_len):
-                data = self.signal_amplitude_list[i][svec_len - j - 1]
-                point_vec[pvec_len - j - 1].setY(data)
-            # Use replace instead of clear & append to improve performance.
-            self.ui.channel.t[i].series.replace(point_vec)
-
-    def updateFreqDomainChart(self):
-        for i in range(0, 2):
-            point_vec = self.ui.channel.t[i].series.pointsVector()
-            t_domain = [p.y() for p in point_vec]
-            if len(t_domain) > 1000:
-                t_domain = t_domain[0:1000]
-            elif len(t_domain) < 1000:
-                t_domain = t_domain + [0] * (1000 - len(t_domain))
-            f_domain = abs(np.fft.fftshift(np.fft.fft(t_domain)))
-            point_vec = [QPointF(x - 500, f_domain[x]) for x in range(0, 1000)]
-            # Use replace instead of clear & append to improve performance.
-            self.ui.channel.f[i].series.replace(point_vec)
-
-    result_received = Signal(str)
-
-    def peekCallbackQueue(self):
-        try:
-            self.result_received.connect(self.updateResult)
-            while True:
-                self.lk.acquire()
-                while not self.callback_queue.empty():
-                    # Throw if the queue blocks more than 1 second.
-                    result_text = self.callback_queue.get(True, 1)
-                    # Notify to update the label with new result.
-                    self.result_received.emit(result_text)
-                self.lk.release()
-                # Prevnet the UI thread from getting stuck.
-                time.sleep(0.01)
-        except Exception as e:
-            print(f'Exception in peekCallbackQueue, {e}')  
-
-    @Slot(str)
-    def updateResult(self, result_text):
+    def updateTimeDomainChart(self, recent_data):
+        for i in range(0, CHANNEL_COUNT):
+            chart = self.ui.channel.t[i]
+            x, y = decimateMinMax(self.chart_x, recent_data[i], plotColumns(chart.chart))
+            # Fill the point buffer from the arrays in one call.
+            fillSeries(chart.series, x, y)
+
+    def updateFreqDomainChart(self, t_domain):
+        # Back from the averaged power to the FFT magnitude the chart is scaled for.
+        f_domain = np.sqrt(self.spectrum.update(t_domain) * CHART_WINDOW) * (CHART_WINDOW / 2)
+        for i in range(0, CHANNEL_COUNT):
+            chart = self.ui.channel.f[i]
+            x, y = decimateMinMax(self.freq_x, f_domain[i], plotColumns(chart.chart))
+            fillSeries(chart.series, x, y)
+
+    result_received = Signal(str, object, object)
+
+    @Slot(str, object, object)
+    def updateResult(self, result_text, acquired_at, published_at):
+        start = profiling.now()
         self.ui.startButton.setEnabled(True)
         self.ui.resultLabel.setText(result_text)
+        profiling.since('ui_update', start)
+        profiling.since('result_transit', published_at)
+        # From reading the bytes of the latest sample of the window to showing the result.
+        profiling.since('end_to_end', acquired_at)
 
-    def exportCompleteData(self):
-        complete_dir = 'export/complete/' + self.dateTimeNowStr()
-        if not os.path.exists(complete_dir):
-            os.makedirs(complete_dir)
-        for i in range(0, 2):
-            f = open(complete_dir + '/channel' + str(i + 1) + '.txt', 'w')
-            for elem in self.signal_amplitude_list[i]:
-                f.write(str(elem) + '\n')
-            f.close()
 
-
-def visualProcess(comm_queue, notify_queue, callback_queue):
+def visualProcess(signal_ring, notify_queue, callback_queue):
     app = QApplication(sys.argv)
-    vs_clnt = VisualClient(comm_queue, notify_queue, callback_queue)
+    vs_clnt = VisualClient(signal_ring, notify_queue, callback_queue)
     vs_clnt.show()
-    sys.exit(app.exec())
-
-
-class RecognitionClient(QWidget):
-
-    def __init__(self, comm_queue, notify_queue, callback_queue):
-        super().__init__()
-
-        self.channel_index = 0
-        self.comm_queue = comm_queue
-        self.notify_queue = notify_queue
-        self.callback_queue = callback_queue
-        self.design = design.design('models/1s_model.pkl')
-
-        self.signal_amplitude_list = [list() for i in range(0, 2)]
-
-        self.lk = RLock()
-
-        self.td1 = Thread(target=RecognitionClient.peekCommQueue, args=(self,))
-        self.td1.daemon = True
-        self.td1.start()
-
-        self.td2 = Thread(target=RecognitionClient.peekNotifyQueue, args=(self,))
-        self.td2.daemon = True
-        self.td2.start()
-
-    data_received = Signal()
-
-    def peekCommQueue(self):
-        try:
-            self.data_received.connect(self.analyzeSignalData)
-            while True:
-                self.lk.acquire()
-                while not self.comm_queue.empty():
-                    # Throw if the queue blocks more than 1 second.
-                    data_array = self.comm_queue.get(True, 1)
-                    # Convert 16-bit sampling values to referenced voltage values.
-                    for i in range(0, len(data_array)):
-                        data_array[i] = (data_array[i] / 65536) * 3.3
-                        self.signal_amplitude_list[self.channel_index].append(data_array[i])
-                        self.channel_index = (self.channel_index + 1) % 2
-                    # Notify to update the chart with new data.
-                    self.data_received.emit()
-                self.lk.release()
-                # Prevnet the UI thread from getting stuck.
-                time.sleep(0.01)
-        except Exception as e:
-            print(f'Exception in peekCommQueue, {e}')
-
-    def peekNotifyQueue(self):
-        try:
-            while True:
-                self.lk.acquire()
-                while not self.notify_queue.empty():
-                    msg_text = self.notify_queue.get(True, 1)
-                    if msg_text == 'CLOSE':
-                        os._exit(0) # Use this to terminate all threads.
-                self.lk.release()
-                # Prevent the main thread from getting stuck.
-                time.sleep(0.01)
-        except Exception as e:
-            print(f'Exception in peekNotifyQueue, {e}')
-
-    # last_signal_index = 1000
-    # last_signal_name = '静息'
-
-    # prev_signal_names = ['静息' for i in range(0,4)]
-
-    def analyzeSignalData(self):
-        datasize = min(len(self.signal_amplitude_list[0]), len(self.signal_amplitude_list[1]))
-
-        # Continuous Check
-        if datasize > 1000:
-            data1 = self.signal_amplitude_list[0][-1000:]
-            data2 = self.signal_amplitude_list[1][-1000:]
-            data_array = np.vstack((data1, data2))
-            self.callback_queue.put(self.design.func(data_array))
-
-        # Double Check
-        # if datasize - self.last_signal_index > 200:
-        #     self.last_signal_index = datasize
-        #     data1 = self.signal_amplitude_list[0][-1000:]
-        #     data2 = self.signal_amplitude_list[1][-1000:]
-        #     data_array = np.vstack((data1, data2))
-        #     curr_signal_name = self.design.func(data_array)
-        #     if curr_signal_name == self.last_signal_name:
-        #         self.callback_queue.put(curr_signal_name)
-        #     self.last_signal_name = curr_signal_name
-
-        # Multi Check
-        # if datasize > 1000:
-        #     data1 = self.signal_amplitude_list[0][-1000:]
-        #     data2 = self.signal_amplitude_list[1][-1000:]
-        #     data_array = np.vstack((data1, data2))
-        #     self.prev_signal_names.append(self.design.func(data_array))
-        #     self.prev_signal_names.pop(0)
-        #     # Find max count name.
-        #     name_count_dict = dict()
-        #     for name in self.prev_signal_names:
-        #         if name in name_count_dict:
-        #             name_count_dict[name] = name_count_dict[name] + 1
-        #         else:
-        #             name_count_dict[name] = 1
-        #     max_count = 0
-        #     max_count_name = str()
-        #     for name, count in name_count_dict.items():
-        #         if count > max_count:
-        #             max_count = count
-        #             max_count_name = name
-        #     self.callback_queue.put(max_count_name)
-
-def recognitionProcess(comm_queue, notify_queue, callback_queue):
-    app = QApplication(sys.argv)
-    rg_clnt = RecognitionClient(comm_queue, notify_queue, callback_queue)
-    rg_clnt.hide()
-    sys.exit(app.exec())
+    sys.exit(runWithQt(app, vs_clnt.pipeline()))
 
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
 
-    comm_qs = dict()
-    comm_qs['visual'] = Queue()
-    comm_qs['recognition'] = Queue()
+    # All processes share the signal data received by the Bluetooth client.
+    signal_ring = SharedRing(CHANNEL_COUNT, RING_CAPACITY)
 
     # Bluetooth Client
-    bt_clnt = BluetoothClient(comm_qs)
+    bt_clnt = BluetoothClient(signal_ring)
     bt_clnt.show()
 
     ntfy_q = Queue()
     clbk_q = Queue()
 
     # Visual Client
-    vs_proc = Process(target=visualProcess, args=(comm_qs['visual'],ntfy_q,clbk_q,))
+    vs_proc = Process(target=visualProcess, args=(signal_ring,ntfy_q,clbk_q,))
     vs_proc.start()
 
     # Recognition Client
-    rg_proc = Process(target=recognitionProcess, args=(comm_qs['recognition'],ntfy_q,clbk_q,))
+    # recognitionProcess lives in recognition.py, which imports no Qt module.
+    rg_proc = Process(target=recognitionProcess, args=(signal_ring,ntfy_q,clbk_q,),
+                      kwargs=dict(model_path=MODEL_PATH, channels=CHANNEL_COUNT, capacity=RECOGNITION_CAPACITY,
+                                  stride=RECOGNITION_STRIDE, workers=FEATURE_WORKERS))
     rg_proc.start()
 
     sys.exit(app.exec())
@@ -0,0 +1,74 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import sys
+
+import numpy as np
+
+from dataset import Dataset, findRecordings
+import design
+import feature
+
+
+def processRecording(task):
+    rec, window, stride = task
+    windows = Dataset(window=window, stride=stride, recordings=[rec])
+    denoiser = feature.Denoiser()
+    features = [design.get_batch_feature(batch, denoiser) for _, batch in windows.batches()]
+    features = np.vstack(features + [np.empty((0, rec.channels * len(feature.feature_names)))])
+    return rec.name, windows.offsets, features
+
+
+def writeColumns(output, columns):
+    if output.endswith('.csv'):
+        with open(output, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns.keys())
+            writer.writerows(zip(*columns.values()))
+    else:
+        np.savez(output, **columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extract features and recognize gestures over exported recordings.')
+    parser.add_argument('--root', default='export', help='export directory written by the visual client')
+    parser.add_argument('--model', default='models/1s_model.pkl', help='model to predict with, empty to skip prediction')
+    parser.add_argument('--window', type=int, default=1000, help='window length in samples')
+    parser.add_argument('--stride', type=int, default=1000, help='distance between window starts in samples')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--output', default='features.npz', help='output file, .npz columns or .csv')
+    args = parser.parse_args(argv)
+
+    recordings = findRecordings(args.root)
+    if len(recordings) == 0:
+        print(f'No recordings found in {args.root}')
+        return 1
+
+    tasks = [(rec, args.window, args.stride) for rec in recordings]
+    with ProcessPoolExecutor(args.workers) as executor:
+        results = [result for result in executor.map(processRecording, tasks) if len(result[1]) > 0]
+    if len(results) == 0:
+        print(f'No recording is longer than {args.window} samples')
+        return 1
+
+    features = np.vstack([result[2] for result in results])
+    channels = features.shape[1] // len(feature.feature_names)
+    columns = dict()
+    columns['recording'] = np.concatenate([[name] * len(offsets) for name, offsets, _ in results])
+    columns['offset'] = np.concatenate([offsets for _, offsets, _ in results])
+    for c in range(channels):
+        for i, feature_name in enumerate(feature.feature_names):
+            columns[f'channel{c + 1}_{feature_name}'] = features[:, c * len(feature.feature_names) + i]
+    if args.model:
+        # One predict call over all windows of all recordings.
+        predictions = design.design(args.model).model.predict(features).astype(int)
+        columns['prediction'] = predictions
+        columns['gesture'] = np.array([design.gesture_name[p] for p in predictions])
+
+    writeColumns(args.output, columns)
+    print(f'{len(features)} windows from {len(results)} recordings written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
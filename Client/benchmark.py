@@ -0,0 +1,499 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+from multiprocessing import Process, Queue
+import os
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+from decoder import SampleDecoder
+import design
+import compiled
+import feature
+import render
+from simulator import syntheticSemg
+from transport import SharedRing
+
+
+# Loop implementations the vectorized features are checked against.
+def reference_zc(data):
+    zc = 0
+    for i in range(len(data)):
+        if (data[i]*data[i-1]<0)and(np.fabs(data[i]-data[i-1])>0.0):
+            zc += 1
+    return zc/len(data)
+
+
+def reference_wamp(data):
+    thresh = 0.02*np.max(data)
+    wamp = 0
+    for i in range(len(data)):
+        if np.fabs(data[i]-data[i-1])>thresh:
+            wamp += 1
+    return wamp/len(data)
+
+
+def reference_sampEn(L,std,m,r):
+    N = len(L)
+    xmi = np.array([L[i:i+m] for i in range(N-m)])
+    xmj = np.array([L[i:i+m] for i in range(N-m+1)])
+    B = np.sum([np.sum(np.abs(xmii-xmj).max(axis=1) <= r*std)-1 for xmii in xmi])
+    m += 1
+    xm = np.array([L[i:i+m] for i in range(N-m+1)])
+    A = np.sum([np.sum(np.abs(xmi-xm).max(axis=1) <= r*std)-1 for xmi in xm])
+    return -np.log(A/B)
+
+
+def reference_spectral(data):
+    N = len(data)
+    _, f, P, _ = feature.get_fft_power_spectrum(data, N, 1000, 2)
+    MDF = np.sum(P*f)/np.sum(P)
+    return np.sum(P)/N, MDF, np.sqrt(np.sum(P*((f-MDF)**2))/np.sum(P))
+
+
+def reference_feature(data):
+    mav = np.sqrt(sum(np.fabs(data))/len(data))
+    rms = np.sqrt(sum([x ** 2 for x in data])/ len(data))
+    var = np.var(data)
+    wl = sum(np.fabs(np.diff(data)))/len(data)
+    sampen = reference_sampEn(data,np.std(data),2,0.15)
+    ARC = feature.ARC4ord(data).tolist()
+    return np.array([mav,rms,var,wl,sampen,reference_zc(data),reference_wamp(data),
+                     ARC[1],ARC[2],ARC[3],ARC[4],
+                     *reference_spectral(data)])
+
+
+def make_window(channels=2, length=1000, seed=0):
+    return syntheticSemg(channels, length, seed=seed)
+
+
+# Timings (seconds) and checks of this run, written by --json. Only the
+# timings listed in 'gated' are compared with a --baseline.
+results = {'timings': dict(), 'gated': list(), 'info': dict(), 'checks': dict()}
+
+
+def measure(func, *args, number=20):
+    return min(timeit.repeat(lambda: func(*args), number=number, repeat=3)) / number
+
+
+# gated=False for reference implementations and code this repo does not ship
+# or use, they are printed for comparison but do not fail a --baseline run.
+def timing(name, seconds, unit='ms', gated=True):
+    results['timings'][name] = seconds
+    if gated:
+        results['gated'].append(name)
+    scale = {'ms': 1e3, 'us': 1e6}[unit]
+    print(f'{name:<24} {seconds * scale:9.3f} {unit}')
+
+
+def check(name, actual, expected, rtol=1e-9, atol=1e-12):
+    ok = bool(np.allclose(actual, expected, rtol=rtol, atol=atol))
+    err = np.max(np.abs(np.asarray(actual) - np.asarray(expected)))
+    results['checks'][name] = results['checks'].get(name, True) and ok
+    print(f'{name:<24} {"ok" if ok else "MISMATCH"} (max abs error {err:.3g})')
+    return ok
+
+
+def run_features():
+    block = make_window()
+    ok = True
+    for x in block:
+        ok &= check('get_zc', feature.get_zc(x), reference_zc(x))
+        ok &= check('get_wamp', feature.get_wamp(x), reference_wamp(x))
+        ok &= check('get_feature', feature.get_feature(x), reference_feature(x))
+    ok &= check('sampEn', feature.sampEn(block[0], np.std(block[0]), 2, 0.15),
+                reference_sampEn(block[0], np.std(block[0]), 2, 0.15))
+    sliding = feature.SlidingSampEn(block.shape[1], 2, 0.15 * np.std(block[0]))
+    sliding.update(block[0])
+    ok &= check('SlidingSampEn', sliding.entropy(),
+                reference_sampEn(block[0], np.std(block[0]), 2, 0.15))
+    ok &= check('denoise (block)', feature.denoise(block),
+                np.array([feature.denoise(x) for x in block]), rtol=0, atol=0)
+    tracker = feature.FeatureTracker(block.shape[0], block.shape[1], stride=block.shape[1])
+    tracker.update(block)
+    ok &= check('FeatureTracker', tracker.features(), feature.get_features(block))
+    # Slide in blocks shorter than the window, without a refresh in between,
+    # so the running MAV/RMS/VAR/WL/ZC/WAMP sums carry the features. The
+    # signal is centered, so the zero crossings are exercised too.
+    window = block.shape[1]
+    stream = make_window(length=2 * window, seed=1) - 1.65
+    sliding_columns = [0, 1, 2, 3, 5, 6]
+    tracker = feature.FeatureTracker(block.shape[0], window, stride=window)
+    tracker.update(stream[:, :window])
+    for end in range(window + 90, 2 * window, 90):
+        tracker.update(stream[:, end - 90:end])
+        ok &= check(f'FeatureTracker (slide to {end})', tracker.features()[:, sliding_columns],
+                    feature.get_features(tracker.data)[:, sliding_columns], rtol=1e-7, atol=1e-9)
+    ok &= check('get_features (block)', feature.get_features(block),
+                np.array([reference_feature(x) for x in block]))
+    # Relative to the size of each coefficient, the x^4 one is around 1e-12.
+    reference_arc = np.apply_along_axis(feature.ARC4ord, 0, block.T)
+    arc_scale = np.max(np.abs(reference_arc), axis=1, keepdims=True)
+    ok &= check('get_ARC4 (block)', feature.get_ARC4(block.T) / arc_scale, reference_arc / arc_scale)
+
+    timing("reference_spectral x2", measure(lambda: [reference_spectral(x) for x in block]), gated=False)
+    timing("Spectrum (block)", measure(feature.Spectrum().features, block))
+    timing("denoise x2", measure(lambda: [feature.denoise(x) for x in block]))
+    timing("denoise (block)", measure(feature.denoise, block))
+    timing('polyfit x2', measure(lambda: np.apply_along_axis(feature.ARC4ord, 0, block.T)), gated=False)
+    timing('get_ARC4 (block)', measure(feature.get_ARC4, block.T))
+    std = np.std(block[0])
+    timing("reference_sampEn", measure(reference_sampEn, block[0], std, 2, 0.15, number=3), gated=False)
+    timing("sampEn", measure(feature.sampEn, block[0], std, 2, 0.15))
+    timing("SlidingSampEn (k=50)", measure(sliding.update, block[1][:50]))
+    timing("reference_feature x2", measure(lambda: [reference_feature(x) for x in block], number=3), gated=False)
+    timing("get_feature x2", measure(lambda: [feature.get_feature(x) for x in block], number=3))
+    timing("get_features (block)", measure(feature.get_features, block, number=3))
+    timing("FeatureTracker (k=50)", measure(lambda: (tracker.update(block[:, :50]), tracker.features())))
+    return ok
+
+
+# Every public feature function on one channel of a 1 s window, and the whole
+# recognition path through design.func with the stand-in model.
+def run_functions():
+    window = make_window()
+    x = window[0]
+    std = np.std(x)
+    functions = [
+        ('denoise', feature.denoise, x),
+        ('sampEn', feature.sampEn, x, std, 2, 0.15),
+        ('get_zc', feature.get_zc, x),
+        ('get_wamp', feature.get_wamp, x),
+        ('get_ARC4', feature.get_ARC4, x),
+        ('get_MNF', feature.get_MNF, x),
+        ('get_MDF', feature.get_MDF, x),
+        ('get_FD', feature.get_FD, x),
+        ('get_feature', feature.get_feature, x),
+    ]
+    for name, func, *args in functions:
+        timing(name, measure(func, *args))
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.pkl')
+        make_stand_in_model(model_path)
+        recognizer = design.design(model_path)
+        recognizer.warmUp(*window.shape)
+        timing('design.func', measure(recognizer.func, window))
+    return True
+
+
+# Previous client path: struct.unpack into a list, then a per-sample loop.
+def reference_decode(data):
+    values = list(struct.unpack('H' * (len(data) // 2), data))
+    channels = [list(), list()]
+    for i in range(0, len(values)):
+        channels[i % 2].append((values[i] / 65536) * 3.3)
+    return channels
+
+
+def run_decoder():
+    data = np.random.default_rng(0).integers(0, 65536, 512, dtype='<u2').tobytes()
+    decoder = SampleDecoder(2)
+    ok = check('SampleDecoder', decoder.decode(data), np.array(reference_decode(data)), rtol=1e-6, atol=0)
+    timing("reference_decode (1 KiB)", measure(reference_decode, data), 'us', gated=False)
+    timing("SampleDecoder (1 KiB)", measure(decoder.decode, data), 'us')
+    return ok
+
+
+# Previous transport: a Queue per consumer polled every 10 ms.
+def queue_consumer(queue, results, total):
+    received = 0
+    arrivals = []
+    while received < total:
+        while not queue.empty():
+            block = queue.get(True, 1)
+            received += block.shape[1]
+            arrivals.append((received, time.perf_counter()))
+        time.sleep(0.01)
+    results.put(arrivals)
+
+
+def ring_consumer(reader, results, total):
+    received = 0
+    arrivals = []
+    while received < total:
+        block = reader.read(5)
+        received += block.shape[1]
+        arrivals.append((received, time.perf_counter()))
+    results.put(arrivals)
+
+
+# Stream `blocks` 2-channel blocks to two consumer processes, one block every
+# `interval` seconds (0 for as fast as possible), and return the throughput in
+# samples per second plus the per-block latencies.
+def stream(kind, blocks, block_size, interval):
+    total = blocks * block_size
+    results = Queue()
+    if kind == 'queue':
+        queues = [Queue(), Queue()]
+        consumers = [Process(target=queue_consumer, args=(q, results, total)) for q in queues]
+        send = lambda block: [q.put(block) for q in queues]
+    else:
+        ring = SharedRing(2, total)
+        consumers = [Process(target=ring_consumer, args=(ring.reader(), results, total)) for _ in range(2)]
+        send = ring.write
+    for p in consumers:
+        p.start()
+    time.sleep(0.5)
+    block = np.zeros((2, block_size), np.float32)
+    sent = np.empty(blocks)
+    for i in range(blocks):
+        sent[i] = time.perf_counter()
+        send(block)
+        while interval and time.perf_counter() - sent[i] < interval:
+            pass
+    latencies = []
+    finished = 0
+    for _ in consumers:
+        counts, times = np.array(results.get()).T
+        # A read can deliver several blocks, each one arrives with it.
+        arrived = times[np.searchsorted(counts, np.arange(1, blocks + 1) * block_size)]
+        latencies.append(arrived - sent)
+        finished = max(finished, times[-1])
+    for p in consumers:
+        p.join()
+    if kind == 'ring':
+        ring.unlink()
+    return total / (finished - sent[0]), np.concatenate(latencies)
+
+
+def run_transport(blocks=2000, block_size=128):
+    for kind in ('queue', 'ring'):
+        rate, _ = stream(kind, blocks, block_size, 0)
+        _, latency = stream(kind, blocks, block_size, 0.001)
+        results['info'][f'{kind} transport samples/s'] = rate
+        print(f'{kind + " transport":<24} {rate / 1e6:9.3f} Msamples/s')
+        # The Queue transport is only the comparison for the shared ring.
+        timing(f'{kind} latency median', np.median(latency), gated=kind == 'ring')
+        timing(f'{kind} latency p99', np.percentile(latency, 99), gated=kind == 'ring')
+    return True
+
+
+# NumPy part of a chart frame: decimating a 1001-point time window to 400
+# pixel columns and the spectrum of the channels. The Qt side is one
+# replaceNp per series instead of one QPointF per point.
+def run_render(columns=400):
+    rng = np.random.default_rng(0)
+    x = np.arange(1001, dtype=np.float64)
+    y = rng.standard_normal(1001).astype(np.float32)
+    dx, dy = render.decimateMinMax(x, y, columns)
+    starts = np.linspace(0, len(y), columns, endpoint=False).astype(int)
+    ends = np.append(starts[1:], len(y))
+    expected = np.ravel([(y[a:b].min(), y[a:b].max()) for a, b in zip(starts, ends)])
+    ok = check('decimateMinMax', dy, expected, rtol=0, atol=0)
+    ok &= check('decimateMinMax x', dx, np.repeat(x[starts], 2), rtol=0, atol=0)
+    timing("decimateMinMax (1001)", measure(render.decimateMinMax, x, y, columns), 'us')
+    timing("points loop (1001)", measure(lambda: [(a, b) for a, b in zip(x, y)]), 'us', gated=False)
+
+    # Spectrum charts: the previous complex, shifted FFT against the tapered
+    # real FFT with averaging across frames.
+    from scipy.signal import get_window
+    block = make_window()
+    taper = get_window('hann', block.shape[1])
+    tapered = (block - block.mean(axis=-1, keepdims=True)) * taper
+    expected = (2 / block.shape[1] * np.abs(np.fft.rfft(tapered)[:, :block.shape[1] // 2])) ** 2 / block.shape[1]
+    average = feature.SpectrumAverage(feature.Spectrum(window='hann', detrend=True), 'welch', frames=4)
+    ok &= check('Spectrum (hann)', average.update(block), expected)
+    timing("fft + fftshift x2", measure(lambda: np.abs(np.fft.fftshift(np.fft.fft(block, axis=-1), axes=-1))), 'us', gated=False)
+    timing("SpectrumAverage x2", measure(average.update, block), 'us')
+    return ok
+
+
+# Feature extraction of one window for 2, 4 and 6 channels, on the calling
+# thread and split over a thread pool of one worker per channel.
+def run_channels(workers=6):
+    ok = True
+    with ThreadPoolExecutor(workers) as executor:
+        for channels in (2, 4, 6):
+            data_batch = make_window(channels)[np.newaxis]
+            sequential = design.get_batch_feature(data_batch)
+            ok &= check(f'parallel features x{channels}',
+                        design.get_batch_feature(data_batch, executor=executor, chunks=channels), sequential)
+            timing(f'features x{channels} sequential', measure(design.get_batch_feature, data_batch, number=5))
+            timing(f'features x{channels} parallel',
+                   measure(lambda: design.get_batch_feature(data_batch, executor=executor, chunks=channels), number=5))
+    return ok
+
+
+# Small model with the input and output shape of the real one, so the
+# benchmarks do not depend on models/1s_model.pkl.
+def make_stand_in_model(model_path, channels=2):
+    from sklearn.linear_model import LogisticRegression
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((120, channels * len(feature.feature_names)))
+    y = np.arange(120) % len(design.gesture_name)
+    design.saveModel(LogisticRegression(max_iter=1000).fit(x, y), model_path)
+
+
+# Compiled NumPy-only models against sklearn's predict: the same predictions
+# on random feature vectors, and the latency of one 1 x 28 window.
+def run_inference():
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import MinMaxScaler, StandardScaler
+    from sklearn.svm import SVC
+    from sklearn.tree import DecisionTreeClassifier
+    rng = np.random.default_rng(0)
+    # Off zero like the features, so a scaler that wrongly centers shows up.
+    x = 2 + rng.standard_normal((300, 2 * len(feature.feature_names)))
+    y = np.argmax((x - 2) @ rng.standard_normal((x.shape[1], len(design.gesture_name))), axis=1)
+    # Twice the spread of the training data, so MinMaxScaler clips.
+    x_test = 2 + 2 * rng.standard_normal((1000, x.shape[1]))
+    models = {
+        'logistic': LogisticRegression(max_iter=1000),
+        'svc': make_pipeline(StandardScaler(), SVC()),
+        'no mean': make_pipeline(StandardScaler(with_mean=False), LogisticRegression(max_iter=1000)),
+        'no std': make_pipeline(StandardScaler(with_std=False), LogisticRegression(max_iter=1000)),
+        'minmax clip': make_pipeline(MinMaxScaler(clip=True), LogisticRegression(max_iter=1000)),
+        'tree': DecisionTreeClassifier(random_state=0),
+        'forest': RandomForestClassifier(50, random_state=0),
+    }
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, model in models.items():
+            model.fit(x, y)
+            model_path = os.path.join(tmp, name + '.npz')
+            compiled.convertModel(model).save(model_path)
+            compiled_model = compiled.loadModel(model_path)
+            ok &= check(f'compiled {name}', compiled_model.predict(x_test), model.predict(x_test), rtol=0, atol=0)
+            window = x_test[:1]
+            timing(f'predict {name}', measure(model.predict, window, number=200), 'us', gated=False)
+            timing(f'compiled {name}', measure(compiled_model.predict, window, number=200), 'us')
+    return ok
+
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import engine
+imported = time.perf_counter()
+import numpy as np
+e = engine.RecognitionEngine(sys.argv[1], mmap_mode=sys.argv[2] or None)
+e.feed(np.random.default_rng(0).normal(1.65, 0.1, (2, 1001)))
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+# The recognition process of the client started as on Windows (spawn): time
+# from starting it to its first result, while the ring is fed.
+SPAWN_SCRIPT = """
+import multiprocessing, queue, sys, time
+import numpy as np
+import recognition
+from transport import SharedRing
+if __name__ == '__main__':
+    multiprocessing.set_start_method('spawn')
+    ring = SharedRing(2, 10000)
+    notify_queue, callback_queue = multiprocessing.Queue(), multiprocessing.Queue()
+    start = time.perf_counter()
+    process = multiprocessing.Process(target=recognition.recognitionProcess, args=(ring, notify_queue, callback_queue),
+                                      kwargs=dict(model_path=sys.argv[1], channels=2, stride=100))
+    process.start()
+    block = np.random.default_rng(0).normal(1.65, 0.1, (2, 100))
+    while True:
+        ring.write(block)
+        try:
+            callback_queue.get(timeout=0.02)
+            break
+        except queue.Empty:
+            pass
+    print(time.perf_counter() - start)
+    notify_queue.put('CLOSE')
+    # The child leaves with os._exit, possibly holding the ring lock, so no close.
+    process.join()
+    ring.unlink()
+"""
+
+
+# Cold start of a fresh process: importing the engine, then loading the model
+# and recognizing the first window.
+def run_startup(repeat=3):
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'model.pkl')
+        make_stand_in_model(model_path)
+        compiled.exportModel(model_path, os.path.join(tmp, 'model.npz'))
+        for model_name, mmap_mode in (('model.pkl', ''), ('model.pkl', 'r'), ('model.npz', '')):
+            model_path = os.path.join(tmp, model_name)
+            times = list()
+            for _ in range(repeat):
+                output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, model_path, mmap_mode],
+                                        cwd=os.path.dirname(os.path.abspath(__file__)),
+                                        capture_output=True, text=True, check=True).stdout
+                times.append([float(t) for t in output.split()])
+            imported, first_result = np.min(times, axis=0)
+            label = 'compiled' if model_name.endswith('.npz') else f'mmap={mmap_mode or "None"}'
+            timing(f'import {label}', imported)
+            timing(f'first result {label}', first_result)
+        times = list()
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', SPAWN_SCRIPT, os.path.join(tmp, 'model.npz')],
+                                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    capture_output=True, text=True, check=True).stdout
+            times.append(float(output))
+        timing('first result spawned', min(times))
+    return True
+
+
+sections = {
+    'decoder': run_decoder,
+    'features': run_features,
+    'functions': run_functions,
+    'render': run_render,
+    'channels': run_channels,
+    'inference': run_inference,
+    'transport': run_transport,
+    'startup': run_startup,
+}
+
+
+# Gated timings more than `tolerance` (relative) slower than in the baseline file.
+def regressions(baseline, tolerance):
+    slower = list()
+    for name in results['gated']:
+        seconds = results['timings'][name]
+        reference = baseline['timings'].get(name)
+        if reference is not None and seconds > reference * (1 + tolerance):
+            slower.append((name, reference, seconds))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check and time the signal processing against the reference implementations.')
+    parser.add_argument('sections', nargs='*', help=f'sections to run ({", ".join(sections)}), all by default')
+    parser.add_argument('--json', help='write the timings and checks to this file')
+    parser.add_argument('--baseline', help='fail if a gated timing is slower than in this --json file of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown against the baseline')
+    args = parser.parse_args(argv)
+    for name in args.sections:
+        if name not in sections:
+            parser.error(f'unknown section {name}')
+
+    ok = True
+    for name in args.sections or sections:
+        ok &= sections[name]()
+
+    results['info']['python'] = platform.python_version()
+    results['info']['numpy'] = np.__version__
+    results['info']['machine'] = platform.machine()
+    results['info']['cpu count'] = os.cpu_count()
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        for name, reference, seconds in regressions(baseline, args.tolerance):
+            print(f'{name:<24} REGRESSION {reference * 1e3:.4g} ms -> {seconds * 1e3:.4g} ms')
+            ok = False
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import numpy as np
+
+
+# Preallocated multi-channel ring buffer for sampled signals.
+# Every block is written twice, at its slot and one capacity further, so the
+# latest samples are always contiguous in memory and can be returned as
+# (channels, n) views without copying. A view stays valid until the samples
+# it covers are overwritten, i.e. after `capacity` more samples are appended.
+class RingBuffer:
+    def __init__(self, channels, capacity, dtype=np.float64):
+        self.channels = channels
+        self.capacity = capacity
+        self.data = np.zeros((channels, 2 * capacity), dtype=dtype)
+        # Slot of the next sample to write.
+        self.pos = 0
+        # Number of samples appended so far, also the absolute index of the next one.
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def clear(self):
+        self.pos = 0
+        self.total = 0
+
+    def append(self, block):
+        block = np.asarray(block).reshape(self.channels, -1)
+        n = block.shape[1]
+        self.total += n
+        if n > self.capacity:
+            # Only the last capacity samples can survive anyway.
+            self.pos = (self.pos + n - self.capacity) % self.capacity
+            block = block[:, -self.capacity:]
+            n = self.capacity
+        head = min(n, self.capacity - self.pos)
+        for offset in (0, self.capacity):
+            self.data[:, offset + self.pos:offset + self.pos + head] = block[:, :head]
+            self.data[:, offset:offset + n - head] = block[:, head:]
+        self.pos = (self.pos + n) % self.capacity
+
+    # View of the last n samples (all retained samples if n is None).
+    def last(self, n=None):
+        n = len(self) if n is None else min(n, len(self))
+        end = self.pos + self.capacity
+        return self.data[:, end - n:end]
+
+    # View of the samples with absolute indices in [start, stop), clipped to
+    # the samples that are still retained.
+    def range(self, start, stop=None):
+        stop = self.total if stop is None else min(stop, self.total)
+        start = max(start, self.total - len(self))
+        if start >= stop:
+            return self.data[:, 0:0]
+        end = self.pos + self.capacity - (self.total - stop)
+        return self.data[:, end - (stop - start):end]
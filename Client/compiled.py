@@ -0,0 +1,242 @@
+import sys
+
+import numpy as np
+
+
+# NumPy-only form of the gesture model. exportModel converts a fitted sklearn
+# estimator into a list of steps made of plain arrays and saves them as .npz;
+# loadModel reads them back into a CompiledModel whose predict runs without
+# importing sklearn. Supported: StandardScaler, MinMaxScaler and MaxAbsScaler
+# steps of a Pipeline, followed by a linear classifier (LogisticRegression,
+# LinearSVC, RidgeClassifier, SGDClassifier, ...), an SVC, a decision tree or
+# a random / extra trees forest.
+
+
+def _affine(mul, add):
+    return 'affine', {'mul': np.asarray(mul, float), 'add': np.asarray(add, float)}
+
+
+def _convertScaler(model):
+    name = type(model).__name__
+    n = model.n_features_in_
+    if name == 'StandardScaler':
+        # mean_ is also fitted with with_mean=False, but then not subtracted.
+        scale = model.scale_ if model.with_std else np.ones(n)
+        mean = model.mean_ if model.with_mean else np.zeros(n)
+        return _affine(1.0/scale, -mean/scale)
+    if name == 'MinMaxScaler':
+        kind, params = _affine(model.scale_, model.min_)
+        if model.clip:
+            params['clip'] = np.asarray(model.feature_range, float)
+        return kind, params
+    if name == 'MaxAbsScaler':
+        return _affine(1.0/model.scale_, np.zeros(n))
+    return None
+
+
+# All trees of a forest in flat arrays, the node indices of tree t start at roots[t].
+def _convertTrees(trees, classes):
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    offset = 0
+    depth = 0
+    for tree in trees:
+        t = tree.tree_
+        is_leaf = t.children_left < 0
+        roots.append(offset)
+        # Leaves point at themselves, so every sample can take the same number of steps.
+        index = np.arange(t.node_count)
+        left.append(np.where(is_leaf, index, t.children_left) + offset)
+        right.append(np.where(is_leaf, index, t.children_right) + offset)
+        feature.append(np.where(is_leaf, 0, t.feature))
+        threshold.append(t.threshold)
+        proba = t.value[:, 0, :]
+        value.append(proba / np.sum(proba, axis=1, keepdims=True))
+        offset += t.node_count
+        depth = max(depth, t.max_depth)
+    return 'trees', {
+        'left': np.concatenate(left), 'right': np.concatenate(right),
+        'feature': np.concatenate(feature), 'threshold': np.concatenate(threshold),
+        'value': np.concatenate(value), 'roots': np.array(roots), 'depth': np.array(depth),
+        'classes': np.asarray(classes),
+    }
+
+
+_KERNELS = ['linear', 'poly', 'rbf', 'sigmoid']
+
+
+def _convertEstimator(model):
+    name = type(model).__name__
+    if name in ('DecisionTreeClassifier', 'ExtraTreeClassifier'):
+        return _convertTrees([model], model.classes_)
+    if name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        return _convertTrees(model.estimators_, model.classes_)
+    if name in ('SVC', 'NuSVC'):
+        if model.kernel not in _KERNELS:
+            raise TypeError(f'SVC kernel {model.kernel} is not supported')
+        return 'svc', {
+            'support_vectors': np.asarray(model.support_vectors_, float),
+            'dual_coef': np.asarray(model.dual_coef_, float),
+            'intercept': np.asarray(model.intercept_, float),
+            'n_support': np.asarray(model.n_support_),
+            'kernel': np.array(_KERNELS.index(model.kernel)),
+            'gamma': np.array(float(model._gamma)),
+            'coef0': np.array(float(model.coef0)),
+            'degree': np.array(float(model.degree)),
+            'classes': np.asarray(model.classes_),
+        }
+    if hasattr(model, 'coef_') and hasattr(model, 'classes_'):
+        return 'linear', {
+            'coef': np.atleast_2d(np.asarray(model.coef_, float)),
+            'intercept': np.atleast_1d(np.asarray(model.intercept_, float)),
+            'classes': np.asarray(model.classes_),
+        }
+    raise TypeError(f'{name} can not be compiled')
+
+
+def convertModel(model):
+    steps = [step for _, step in model.steps] if hasattr(model, 'steps') else [model]
+    converted = list()
+    for step in steps[:-1]:
+        if step is None or step == 'passthrough':
+            continue
+        scaler = _convertScaler(step)
+        if scaler is None:
+            raise TypeError(f'{type(step).__name__} can not be compiled')
+        converted.append(scaler)
+    converted.append(_convertEstimator(steps[-1]))
+    return CompiledModel(converted, getattr(model, 'n_features_in_', None))
+
+
+def _kernel(params, X):
+    sv = params['support_vectors']
+    kernel = _KERNELS[int(params['kernel'])]
+    if kernel == 'rbf':
+        distance = np.sum(X*X, axis=1)[:, np.newaxis] - 2*(X @ sv.T) + np.sum(sv*sv, axis=1)
+        return np.exp(-params['gamma'] * np.maximum(distance, 0))
+    dot = X @ sv.T
+    if kernel == 'linear':
+        return dot
+    if kernel == 'poly':
+        return (params['gamma']*dot + params['coef0'])**params['degree']
+    return np.tanh(params['gamma']*dot + params['coef0'])
+
+
+# The one-vs-one classifiers of libsvm as one matrix: column p holds the
+# coefficients of the support vectors of the pair p = (i, j), and the pair
+# votes for i if its decision is positive, else for j.
+def _prepareSvc(params):
+    n_support = params['n_support']
+    starts = np.concatenate(([0], np.cumsum(n_support)))
+    dual_coef = params['dual_coef']
+    classes = len(n_support)
+    pairs = [(i, j) for i in range(classes) for j in range(i + 1, classes)]
+    coef = np.zeros((dual_coef.shape[1], len(pairs)))
+    vote_i = np.zeros((len(pairs), classes), int)
+    vote_j = np.zeros((len(pairs), classes), int)
+    for p, (i, j) in enumerate(pairs):
+        si = slice(starts[i], starts[i + 1])
+        sj = slice(starts[j], starts[j + 1])
+        coef[si, p] = dual_coef[j - 1, si]
+        coef[sj, p] = dual_coef[i, sj]
+        vote_i[p, i] = 1
+        vote_j[p, j] = 1
+    # sklearn flips the signs of binary models, so positive means the second class there.
+    sign = -1.0 if classes == 2 else 1.0
+    return {'pair_coef': sign*coef, 'pair_intercept': sign*params['intercept'], 'vote_i': vote_i, 'vote_j': vote_j}
+
+
+def _predictSvc(params, X):
+    decision = _kernel(params, X) @ params['pair_coef'] + params['pair_intercept']
+    positive = decision > 0
+    votes = positive @ params['vote_i'] + (~positive) @ params['vote_j']
+    return params['classes'][np.argmax(votes, axis=1)]
+
+
+def _predictTrees(params, X):
+    # sklearn compares float32 features with the thresholds.
+    X = np.asarray(X, np.float32).astype(float)
+    rows = np.arange(len(X))[:, np.newaxis]
+    node = np.broadcast_to(params['roots'], (len(X), len(params['roots']))).copy()
+    for _ in range(int(params['depth'])):
+        go_left = X[rows, params['feature'][node]] <= params['threshold'][node]
+        node = np.where(go_left, params['left'][node], params['right'][node])
+    proba = np.mean(params['value'][node], axis=1)
+    return params['classes'][np.argmax(proba, axis=1)]
+
+
+def _predictLinear(params, X):
+    decision = X @ params['coef'].T + params['intercept']
+    if decision.shape[1] == 1:
+        return params['classes'][(decision[:, 0] > 0).astype(int)]
+    return params['classes'][np.argmax(decision, axis=1)]
+
+
+class CompiledModel:
+    def __init__(self, steps, n_features_in=None):
+        self.steps = steps
+        kind, params = steps[-1]
+        if kind == 'svc':
+            self.steps = steps[:-1] + [(kind, dict(params, **_prepareSvc(params)))]
+        if n_features_in is None:
+            n_features_in = self._featureCount()
+        self.n_features_in_ = n_features_in
+        self.classes_ = params['classes']
+
+    def _featureCount(self):
+        kind, params = self.steps[0]
+        if kind == 'affine':
+            return len(params['mul'])
+        if kind == 'linear':
+            return params['coef'].shape[1]
+        if kind == 'svc':
+            return params['support_vectors'].shape[1]
+        return None
+
+    def predict(self, X):
+        X = np.asarray(X, float).reshape(-1, self.n_features_in_)
+        for kind, params in self.steps[:-1]:
+            X = X*params['mul'] + params['add']
+            if 'clip' in params:
+                X = np.clip(X, params['clip'][0], params['clip'][1])
+        kind, params = self.steps[-1]
+        if kind == 'linear':
+            return _predictLinear(params, X)
+        if kind == 'svc':
+            return _predictSvc(params, X)
+        return _predictTrees(params, X)
+
+    def save(self, path):
+        arrays = {'kinds': np.array([kind for kind, _ in self.steps]),
+                  'n_features_in': np.array(self.n_features_in_)}
+        for i, (_, params) in enumerate(self.steps):
+            for name, value in params.items():
+                # The prepared arrays are derived again on loading.
+                if not name.startswith(('pair_', 'vote_')):
+                    arrays[f'{i}.{name}'] = value
+        np.savez(path, **arrays)
+
+
+def loadModel(path):
+    with np.load(path, allow_pickle=False) as arrays:
+        steps = [(str(kind), dict()) for kind in arrays['kinds']]
+        for key in arrays.files:
+            index, _, name = key.partition('.')
+            if name:
+                steps[int(index)][1][name] = arrays[key]
+        return CompiledModel(steps, int(arrays['n_features_in']))
+
+
+# Compile a model saved by design.saveModel and write it as .npz.
+def exportModel(model_path, output_path):
+    import joblib
+    compiled = convertModel(joblib.load(model_path))
+    compiled.save(output_path)
+    return compiled
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('usage: python compiled.py <model.pkl> <model.npz>')
+        sys.exit(1)
+    exportModel(sys.argv[1], sys.argv[2])
+    print(f'{sys.argv[1]} compiled to {sys.argv[2]}')
@@ -0,0 +1,90 @@
+import glob
+import os
+
+import numpy as np
+
+import recorder
+
+
+# One recording exported by the visual client: a binary recording.semg, or
+# one channelN.npy / channelN.txt file per channel. The files are opened on
+# first access (.semg and .npy are memory-mapped, the legacy .txt files have
+# to be parsed into memory) and closed again when pickled, so recordings can
+# be handed to worker processes cheaply.
+class Recording:
+    def __init__(self, name, paths):
+        self.name = name
+        self.paths = paths
+        self.channel_data = None
+
+    def __getstate__(self):
+        return {'name': self.name, 'paths': self.paths, 'channel_data': None}
+
+    def open(self):
+        if self.channel_data is None:
+            if self.paths[0].endswith('.semg'):
+                # Strided (channels, n) view of the interleaved frames.
+                self.channel_data = recorder.openRecording(self.paths[0])[1].T
+            else:
+                self.channel_data = [np.load(path, mmap_mode='r') if path.endswith('.npy')
+                                     else np.loadtxt(path, ndmin=1) for path in self.paths]
+        return self.channel_data
+
+    @property
+    def channels(self):
+        return len(self.open())
+
+    def __len__(self):
+        return min(len(data) for data in self.open())
+
+    # (channels, length) samples starting at offset. This is a view for
+    # .semg recordings, the per-channel files have to be stacked into a copy.
+    def window(self, offset, length):
+        data = self.open()
+        if isinstance(data, np.ndarray):
+            return data[:, offset:offset + length]
+        return np.stack([channel[offset:offset + length] for channel in data])
+
+
+# Find the recordings exported by the visual client under root.
+def findRecordings(root='export'):
+    recordings = list()
+    for kind in ('slices', 'complete'):
+        for rec_dir in sorted(glob.glob(os.path.join(root, kind, '*'))):
+            paths = glob.glob(os.path.join(rec_dir, 'recording.semg'))
+            for ext in ('npy', 'txt'):
+                if len(paths) == 0:
+                    paths = sorted(glob.glob(os.path.join(rec_dir, 'channel*.' + ext)),
+                                   key=lambda path: int(os.path.basename(path)[7:-len(ext) - 1]))
+            if len(paths) > 0:
+                recordings.append(Recording(kind + '/' + os.path.basename(rec_dir), paths))
+    return recordings
+
+
+# Random access to the fixed-length windows of a set of recordings.
+# Window i starts at offsets[i] in recordings[recording_index[i]].
+class Dataset:
+    def __init__(self, root='export', window=1000, stride=1000, recordings=None):
+        self.window = window
+        self.stride = stride
+        self.recordings = findRecordings(root) if recordings is None else recordings
+        counts = [max(0, (len(rec) - window) // stride + 1) for rec in self.recordings]
+        self.recording_index = np.repeat(np.arange(len(self.recordings)), counts)
+        self.offsets = np.concatenate([np.arange(count) * stride for count in counts] + [np.empty(0, int)])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        return self.recordings[self.recording_index[i]].window(self.offsets[i], self.window)
+
+    # (recording name, offset) of window i.
+    def index(self, i):
+        return self.recordings[self.recording_index[i]].name, int(self.offsets[i])
+
+    # Yield (indices, (batch, channels, window) array) pairs. Only one batch
+    # is held in memory, the rest stays on disk until it is paged in.
+    def batches(self, batch_size=256):
+        for start in range(0, len(self), batch_size):
+            indices = np.arange(start, min(start + batch_size, len(self)))
+            yield indices, np.stack([self[i] for i in indices])
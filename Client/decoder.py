@@ -0,0 +1,30 @@
+import numpy as np
+
+
+# Turns the raw byte stream of the device into (channels, n) voltage blocks.
+# The device sends each frame as interleaved little-endian uint16 samples, one
+# per channel (see SEND_CHANNEL_DATA in server.c). A read can end anywhere in a
+# frame, so the bytes of an incomplete frame (an odd byte or the samples of
+# the first channels) are kept and completed by the next read.
+class SampleDecoder:
+    def __init__(self, channels=2, vref=3.3, dtype=np.float32):
+        self.channels = channels
+        self.frame_size = 2 * channels
+        self.scale = np.dtype(dtype).type(vref / 65536)
+        self.pending = b''
+
+    def reset(self):
+        self.pending = b''
+
+    # Returns the complete frames as a (channels, n) uint16 array.
+    def decodeRaw(self, data):
+        if self.pending:
+            data = self.pending + bytes(data)
+        usable = len(data) - len(data) % self.frame_size
+        self.pending = bytes(data[usable:])
+        raw = np.frombuffer(data, dtype='<u2', count=usable // 2)
+        return raw.reshape(-1, self.channels).T
+
+    # Returns the complete frames as a (channels, n) array of referenced voltages.
+    def decode(self, data):
+        return self.decodeRaw(data) * self.scale
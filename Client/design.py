@@ -1,16 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
+
 import feature
-import joblib
 import numpy as np
+from profiling import timed
+
+
+gesture_name = ['握拳', 'OK', '内翻', '外翻', '点赞', '静息']
+
+# Models loaded by this process, keyed by (absolute path, mmap mode).
+_models = dict()
+
+
+# Load a model once per process. With mmap_mode='r' the arrays of a model
+# written by saveModel are memory-mapped instead of copied, so several
+# recognition processes share one copy through the page cache.
+# A .npz model written by compiled.py is predicted with NumPy only.
+def loadModel(model_path, mmap_mode=None):
+    key = (os.path.abspath(model_path), mmap_mode)
+    if key not in _models:
+        if model_path.endswith('.npz'):
+            import compiled
+            _models[key] = compiled.loadModel(model_path)
+        else:
+            import joblib
+            _models[key] = joblib.load(model_path, mmap_mode=mmap_mode)
+    return _models[key]
+
+
+# Save a model uncompressed, which joblib needs to memory-map it.
+def saveModel(model, model_path):
+    import joblib
+    joblib.dump(model, model_path)
+
+
+def _get_rows_feature(rows, denoiser=None):
+    with timed('feature.denoise'):
+        rows = feature.denoise(rows) if denoiser is None else denoiser(rows)
+    return feature.get_features(rows)
+
+
+# Denoise a (batch, channels, samples) block and return its (batch, channels * 14)
+# feature matrix, every window laid out channel by channel.
+# With an executor the channel windows are split into `chunks` parts that are
+# processed in parallel. The threads only overlap where NumPy, SciPy and pywt
+# release the GIL, sampEn also loops over its blocks in Python, so whether
+# this pays off depends on the machine (see benchmark.py channels).
+def get_batch_feature(data_batch, denoiser=None, executor=None, chunks=1):
+    batch, channels, samples = np.shape(data_batch)
+    data = np.reshape(data_batch, (batch * channels, samples))
+    if executor is None or chunks <= 1:
+        features = _get_rows_feature(data, denoiser)
+    else:
+        parts = np.array_split(data, min(chunks, len(data)))
+        features = np.vstack(list(executor.map(partial(_get_rows_feature, denoiser=denoiser), parts)))
+    return features.reshape(batch, channels * len(feature.feature_names))
 
 
 class design:
-    def __init__(self, model_path):
-        self.model = joblib.load(model_path)
+    # workers > 1 extracts the features of the channels on a thread pool.
+    def __init__(self, model_path, mmap_mode=None, workers=1):
+        self.model = loadModel(model_path, mmap_mode)
+        self.denoiser = feature.Denoiser()
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(workers) if workers > 1 else None
+
+    # Run one synthetic window through the whole path, so the first real
+    # window does not pay for the lazy imports and FFT plans, and check that
+    # the model fits the channel count and the gesture names.
+    def warmUp(self, channels=2, samples=1000):
+        feature_count = channels * len(feature.feature_names)
+        model_feature_count = getattr(self.model, 'n_features_in_', feature_count)
+        if model_feature_count != feature_count:
+            raise ValueError(f'Model expects {model_feature_count} features, {channels} channels give {feature_count}')
+        data_batch = np.random.default_rng(0).normal(1.65, 0.1, (1, channels, samples))
+        now_gesture = int(self.model.predict(self.getBatchFeature(data_batch))[0])
+        if not 0 <= now_gesture < len(gesture_name):
+            raise ValueError(f'Model predicts unknown gesture {now_gesture}')
 
     def func(self, data_array):
-        data_array[0] = feature.denoise(data_array[0])
-        data_array[1] = feature.denoise(data_array[1])
-        now_feature = np.array([np.hstack((feature.get_feature(data_array[0]), feature.get_feature(data_array[1])))])
-        now_gesture = int(self.model.predict(now_feature)[0])
-        gesture_name = ['握拳', 'OK', '内翻', '外翻', '点赞', '静息']
-        return gesture_name[now_gesture]
+        return self.funcBatch(np.asarray(data_array)[np.newaxis])[0]
+
+    # Recognize a (batch, channels, samples) block of windows with one predict call.
+    def funcBatch(self, data_batch):
+        with timed('features'):
+            features = self.getBatchFeature(data_batch)
+        return self.predictBatch(features)
+
+    # Recognize one window, also returns the probability of every gesture, or
+    # None if the model has no predict_proba (e.g. a compiled .npz model).
+    def funcProbabilities(self, data_array):
+        with timed('features'):
+            features = self.getBatchFeature(np.asarray(data_array)[np.newaxis])
+        result = self.predictBatch(features)[0]
+        if not hasattr(self.model, 'predict_proba'):
+            return result, None
+        with timed('predict_proba'):
+            proba = self.model.predict_proba(features)[0]
+        return result, {gesture_name[int(c)]: p for c, p in zip(self.model.classes_, proba)}
+
+    def getBatchFeature(self, data_batch):
+        return get_batch_feature(data_batch, self.denoiser, self.executor, self.workers)
+
+    # Classify a (channels, 14) feature matrix of a denoised window, as the
+    # model is trained on (see get_batch_feature).
+    def predict(self, features):
+        return self.predictBatch(np.reshape(features, (1, -1)))[0]
+
+    def predictBatch(self, now_features):
+        with timed('predict'):
+            now_gestures = self.model.predict(now_features)
+        return [gesture_name[int(now_gesture)] for now_gesture in now_gestures]
@@ -0,0 +1,131 @@
+import asyncio
+import queue
+from threading import Event, Thread
+
+import numpy as np
+
+from buffer import RingBuffer
+import design
+import profiling
+from scheduler import RecognitionScheduler
+
+
+# Gesture recognition without Qt. Feed it (channels, n) sample blocks and get
+# the gesture names through callbacks, the results() iterator or the stream()
+# async iterator. Subscribers receive None once the engine is closed.
+# The scheduler decides which windows are classified (by default every
+# window) and how the results are smoothed, see scheduler.py.
+# The model is loaded and warmed up in the background while the first window
+# fills up; a loading error is raised by the first feed that needs the model.
+class RecognitionEngine:
+    def __init__(self, model_path, channels=2, window=1000, capacity=4000, callback=None, mmap_mode=None,
+                 scheduler=None, workers=1):
+        self.model_path = model_path
+        self.mmap_mode = mmap_mode
+        self.workers = workers
+        self.channels = channels
+        self.window = window
+        self.signal_buffer = RingBuffer(channels, capacity, np.float32)
+        # Acquisition time (profiling.now()) of the latest block read by run.
+        self.acquired_at = 0
+        self.scheduler = RecognitionScheduler(1) if scheduler is None else scheduler
+        self.callbacks = list()
+        if callback is not None:
+            self.subscribe(callback)
+
+        self.design = None
+        self.error = None
+        self.ready = Event()
+        self.td = Thread(target=RecognitionEngine.load, args=(self,))
+        self.td.daemon = True
+        self.td.start()
+
+    def load(self):
+        try:
+            self.design = design.design(self.model_path, self.mmap_mode, self.workers)
+            self.design.warmUp(self.channels, self.window)
+        except Exception as e:
+            self.error = e
+        self.ready.set()
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        self.callbacks.remove(callback)
+
+    def publish(self, result):
+        for callback in list(self.callbacks):
+            callback(result)
+
+    def close(self):
+        self.publish(None)
+
+    # Append new samples and return the recognized gesture, or None if there
+    # is not enough data yet.
+    def feed(self, signal_block):
+        self.signal_buffer.append(signal_block)
+        return self.analyzeSignalData()
+
+    # Feed all blocks of a transport.RingReader until the ring is closed.
+    def run(self, signal_reader):
+        while True:
+            signal_block = signal_reader.read()
+            if signal_block is None:
+                break
+            self.acquired_at = signal_reader.written_at
+            profiling.since('ring_transit', self.acquired_at)
+            self.feed(signal_block)
+        self.close()
+
+    def results(self, timeout=None):
+        result_queue = queue.Queue()
+        self.subscribe(result_queue.put)
+        try:
+            while True:
+                try:
+                    result = result_queue.get(True, timeout)
+                except queue.Empty:
+                    return
+                if result is None:
+                    return
+                yield result
+        finally:
+            self.unsubscribe(result_queue.put)
+
+    # Results can be published from any thread, they are handed over to the
+    # event loop of the consumer.
+    async def stream(self):
+        loop = asyncio.get_running_loop()
+        result_queue = asyncio.Queue()
+        push = lambda result: loop.call_soon_threadsafe(result_queue.put_nowait, result)
+        self.subscribe(push)
+        try:
+            while True:
+                result = await result_queue.get()
+                if result is None:
+                    return
+                yield result
+        finally:
+            self.unsubscribe(push)
+
+    def analyzeSignalData(self):
+        datasize = self.signal_buffer.total
+        if datasize <= self.window or not self.scheduler.due(datasize):
+            return None
+
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        self.scheduler.start(datasize)
+        start = profiling.now()
+        data_array = self.signal_buffer.last(self.window)
+        if self.scheduler.uses_probabilities:
+            result = self.scheduler.smooth(*self.design.funcProbabilities(data_array))
+        else:
+            result = self.scheduler.smooth(self.design.func(data_array))
+        profiling.since('recognition', start)
+        profiling.count('windows_classified')
+        if result is not None:
+            self.publish(result)
+        return result
@@ -1,41 +1,121 @@
+from functools import lru_cache
 import math
+import threading
 import numpy as np
-import pywt
-from scipy.fft import fft
+from numpy.lib.stride_tricks import sliding_window_view
 
+from profiling import timed
 
+# pywt and scipy are imported where they are used, so importing this module
+# stays cheap for processes that do not run the heavy features right away.
+
+
+# All the time-domain features below work along the last axis, so a single
+# channel (N,) and a block of channels (C, N) go through the same code path.
+# The first sample is compared with the last one (data[i-1] at i = 0).
 def get_zc(data):
     thresh = 0.0
-    zc=0
-    for i in range(len(data)):  
-        if (data[i]*data[i-1]<0)and(np.fabs(data[i]-data[i-1])>thresh):
-            zc+=1
-    return zc/len(data)
+    data = np.asarray(data, dtype=float)
+    prev = np.roll(data, 1, axis=-1)
+    zc = np.count_nonzero((data*prev<0)&(np.fabs(data-prev)>thresh), axis=-1)
+    return zc/data.shape[-1]
 
 
 def get_wamp(data):
-    thresh = 0.02*np.max(data)
-    wamp = 0
-    for i in range(len(data)):
-        if np.fabs(data[i]-data[i-1])>thresh:
-            wamp+=1
-    return wamp/len(data)
+    data = np.asarray(data, dtype=float)
+    thresh = 0.02*np.max(data, axis=-1, keepdims=True)
+    prev = np.roll(data, 1, axis=-1)
+    wamp = np.count_nonzero(np.fabs(data-prev)>thresh, axis=-1)
+    return wamp/data.shape[-1]
+
+
+# Count ordered template pairs (row, col) whose Chebyshev distance is within tol.
+# Rows and columns are sorted by their first coordinate and the rows are taken
+# in blocks: the rows of a block can only match the columns inside
+# [x0 - tol, x0 + tol] of its first and last row, and that slice is compared
+# with the whole block at once, one coordinate at a time.
+def _count_matches(rows, cols, tol, block=64):
+    cols = cols[np.argsort(cols[:, 0], kind='stable')]
+    rows = rows[np.argsort(rows[:, 0], kind='stable')]
+    key = cols[:, 0]
+    # Widen the search range by a few ulps, the exact test is done below.
+    slack = 8*np.finfo(float).eps*(np.max(np.abs(key), initial=0.0)+abs(tol))
+    lo = np.searchsorted(key, rows[:, 0]-tol-slack, 'left')
+    hi = np.searchsorted(key, rows[:, 0]+tol+slack, 'right')
+    matches = 0
+    for start in range(0, len(rows), block):
+        stop = min(start+block, len(rows))
+        r = rows[start:stop]
+        c = cols[lo[start]:hi[stop-1]]
+        match = np.abs(r[:, 0, np.newaxis]-c[:, 0]) <= tol
+        for k in range(1, rows.shape[1]):
+            match &= np.abs(r[:, k, np.newaxis]-c[:, k]) <= tol
+        matches += int(np.count_nonzero(match))
+    return matches
 
 
 def sampEn(L:np.array,std:float,m,r):
+    L = np.asarray(L, dtype=float)
     N = len(L)
-    B = 0.0
-    A = 0.0
-
-    xmi = np.array([L[i:i+m] for i in range(N-m)])
-    xmj = np.array([L[i:i+m] for i in range(N-m+1)])
-     
-    B = np.sum([np.sum(np.abs(xmii-xmj).max(axis=1) <= r*std)-1 for xmii in xmi])
-    m += 1
-    xm = np.array([L[i:i+m] for i in range(N-m+1)])
-    
-    A = np.sum([np.sum(np.abs(xmi-xm).max(axis=1) <= r*std)-1 for xmi in xm])
-    return -np.log(A/B)
+    tol = r*std
+
+    xmj = sliding_window_view(L, m)
+    xmi = xmj[:N-m]
+    B = _count_matches(xmi, xmj, tol)-(N-m)
+
+    xm = sliding_window_view(L, m+1)
+    A = _count_matches(xm, xm, tol)-(N-m)
+    return -np.log(np.float64(A)/B)
+
+
+# Sample entropy of a sliding window with a fixed tolerance. Only the templates
+# that enter or leave the window are compared when it slides by k samples.
+# The tolerance does not follow the window std (sampEn does), call reset()
+# with a new one if the signal level changes.
+class SlidingSampEn:
+    def __init__(self, window, m, tol):
+        self.window = window
+        self.m = m
+        self.tol = tol
+        self.reset()
+
+    def reset(self, tol=None):
+        if tol is not None:
+            self.tol = tol
+        self.data = np.empty(0)
+        # Matching unordered pairs among the m / m+1 length templates.
+        self.pairs = [0, 0]
+
+    def update(self, samples):
+        samples = np.asarray(samples, dtype=float).ravel()
+        full = len(self.data) == self.window
+        data = np.concatenate((self.data, samples))[-self.window:]
+        k = len(samples)
+        if full and k < self.window-self.m:
+            for i, mm in enumerate((self.m, self.m+1)):
+                old = sliding_window_view(self.data, mm)
+                new = sliding_window_view(data, mm)
+                self.pairs[i] += self._pairs_with(new[-k:], new)-self._pairs_with(old[:k], old)
+        elif len(data) == self.window:
+            for i, mm in enumerate((self.m, self.m+1)):
+                t = sliding_window_view(data, mm)
+                self.pairs[i] = (_count_matches(t, t, self.tol)-len(t))//2
+        self.data = data
+
+    # Unordered matching pairs that involve at least one template of part.
+    def _pairs_with(self, part, templates):
+        inner = _count_matches(part, part, self.tol)
+        return _count_matches(part, templates, self.tol)-(inner+len(part))//2
+
+    def entropy(self):
+        if len(self.data) < self.window:
+            return np.nan
+        m = self.m
+        xmj = sliding_window_view(self.data, m)
+        # sampEn compares the first N-m templates with all N-m+1 of them.
+        B = 2*self.pairs[0]-_count_matches(xmj[-1:], xmj[:-1], self.tol)
+        A = 2*self.pairs[1]
+        return -np.log(np.float64(A)/B)
 
 
 def ARC4ord(orinArray):
@@ -43,74 +123,72 @@ def ARC4ord(orinArray):
 		AR_coeffs = np.polyfit(range(tValue),orinArray,4)
 		return AR_coeffs
 		 
+
+# (deg + 1, N) matrix that maps N samples to the coefficients np.polyfit fits
+# over range(N), highest power first. The fit is solved once per window length
+# on the abscissa mapped to [-1, 1], where the Vandermonde matrix is well
+# conditioned, and the coefficients are then expanded back to powers of x.
+@lru_cache(maxsize=8)
+def _polyfit_matrix(N, deg=4):
+    a = 2.0/max(N-1, 1)
+    u = a*np.arange(N) - 1.0
+    pinv = np.linalg.pinv(np.vander(u, deg+1))
+    # p(x) = sum_k c_k (a x - 1)^k, the x^j term collects C(k, j) a^j (-1)^(k-j) c_k.
+    expand = np.zeros((deg+1, deg+1))
+    for k in range(deg+1):
+        for j in range(k+1):
+            expand[deg-j, deg-k] = math.comb(k, j) * a**j * (-1.0)**(k-j)
+    matrix = expand @ pinv
+    matrix.setflags(write=False)
+    return matrix
+
+
+# ARC4ord of every column of an (N,) or (N, C) block with one matrix product.
 def get_ARC4(data):
-    return np.apply_along_axis(ARC4ord, 0, data)
+    data = np.asarray(data, dtype=float)
+    return _polyfit_matrix(data.shape[0]) @ data
 
 
-def sgn(num):
-    if(num > 0.0):
-        return 1.0
-    elif(num == 0.0):
-        return 0.0
-    else:
-        return -1.0
+# Wavelet soft-threshold denoiser. The wavelet is built once, and a (C, N) block
+# is decomposed, thresholded and reconstructed for all channels together.
+class Denoiser:
+    def __init__(self, wavelet='db2', level=4):
+        import pywt
+        self.wavelet = pywt.Wavelet(wavelet)#选择db2小波基
+        self.level = level
 
+    def __call__(self, data):
+        import pywt
+        data = np.asarray(data, dtype=float)
+        coeffs = pywt.wavedec(data, self.wavelet, level=self.level, axis=-1)  # 4层小波分解
 
-def denoise(new_df):
-    data = new_df
-    #data = data.T.tolist()  
-    w = pywt.Wavelet('db2')#选择db2小波基
-    [ca4,cd4, cd3, cd2, cd1] = pywt.wavedec(data, w,level=4)  # 4层小波分解
-
-    length1 = len(cd1)
-    length0 = len(data)
-
-    Cd1 = np.array(cd1)
-    abs_cd1 = np.abs(Cd1)
-    median_cd1 = np.median(abs_cd1)
-
-    sigma = (1.0 / 0.6745) * median_cd1
-    lamda = sigma * math.sqrt(2.0 * math.log(float(length0 ), math.e))#固定阈值计算
-    usecoeffs = []
-    usecoeffs.append(ca4) 
-
-    #软阈值去噪
-    for k in range(length1):
-        if (abs(cd1[k]) >= lamda):
-            cd1[k] = sgn(cd1[k]) * (abs(cd1[k])-lamda)
-        else:
-            cd1[k] = 0.0
+        # 每个通道的固定阈值 (由最细一层的 cd1 估计噪声)
+        sigma = (1.0 / 0.6745) * np.median(np.abs(coeffs[-1]), axis=-1, keepdims=True)
+        lamda = sigma * math.sqrt(2.0 * math.log(float(data.shape[-1]), math.e))
 
-    length2 = len(cd2)
-    for k in range(length2):
-        if (abs(cd2[k]) >= lamda):
-            cd2[k] = sgn(cd2[k]) * (abs(cd2[k]) - lamda)
-        else:
-            cd2[k] = 0.0
+        #软阈值去噪
+        for cd in coeffs[1:]:
+            mag = np.abs(cd)
+            mag -= lamda
+            np.maximum(mag, 0.0, out=mag)
+            np.sign(cd, out=cd)
+            cd *= mag
 
-    length3 = len(cd3)
-    for k in range(length3):
-        if (abs(cd3[k]) >= lamda):
-            cd3[k] = sgn(cd3[k]) * (abs(cd3[k]) - lamda)
-        else:
-            cd3[k] = 0.0
+        return pywt.waverec(coeffs, self.wavelet, axis=-1)#信号重构
 
-    length4 = len(cd4)
-    for k in range(length4):
-        if (abs(cd4[k]) >= lamda):
-            cd4[k] = sgn(cd4[k]) * (abs(cd4[k]) - lamda)
-        else:
-            cd4[k] = 0.0
 
-    usecoeffs.append(cd4)
-    usecoeffs.append(cd3)
-    usecoeffs.append(cd2)
-    usecoeffs.append(cd1)
-    recoeffs = pywt.waverec(usecoeffs, w)#信号重构
-    return recoeffs
+_denoiser = None
+
+
+def denoise(new_df):
+    global _denoiser
+    if _denoiser is None:
+        _denoiser = Denoiser()
+    return _denoiser(new_df)
 
 
 def get_fft_power_spectrum(y_values, N, f_s, f):
+    from scipy.fft import fft
     f_values = np.linspace(0, f_s//f, N//f)
     fft_values_ = np.abs(fft(y_values))
     fft_values = 2/N * (fft_values_[0:int(N/2)])    
@@ -123,81 +201,262 @@ def get_fft_power_spectrum(y_values, N, f_s, f):
     return f_values, fft_values, ps_values, ps_cor_values
 
 
-def get_MDF(x):
-    N = len(x)
-    f_s = 1000
-    f_values, fft_values, ps_values, ps_cor_values = get_fft_power_spectrum(x, N, f_s, 2)
+# One-sided power spectrum shared by all frequency-domain features and the
+# spectrum charts. It takes a real FFT of each window along the last axis, and
+# skips the autocorrelation that get_fft_power_spectrum also computes. Windows
+# can have their mean removed (detrend) and be tapered with a scipy.signal
+# window (e.g. 'hann') first; the features use neither. scipy.fft caches the
+# FFT plan; the frame/amplitude/power buffers are reused while the window shape
+# stays the same, so copy them if they must outlive the next call.
+class Spectrum:
+    def __init__(self, f_s=1000, workers=None, window=None, detrend=False):
+        self.f_s = f_s
+        self.workers = workers
+        self.window = window
+        self.detrend = detrend
+        self.shape = None
+
+    def prepare(self, shape):
+        N = shape[-1]
+        self.shape = shape[:-1] + (N//2,)
+        self.fft_values = np.empty(self.shape)
+        self.ps_values = np.empty(self.shape)
+        self.frame = np.empty(shape) if self.window is not None or self.detrend else None
+        if self.window is not None:
+            from scipy.signal import get_window
+            self.taper = get_window(self.window, N)
+
+    # Frequencies in Hz of the values returned by power for N-sample windows.
+    def frequencies(self, N):
+        return np.arange(N//2) * (self.f_s / N)
+
+    def power(self, x):
+        from scipy.fft import rfft
+        x = np.asarray(x, dtype=float)
+        N = x.shape[-1]
+        if x.shape[:-1] + (N//2,) != self.shape or (self.frame is not None and self.frame.shape != x.shape):
+            self.prepare(x.shape)
+        if self.frame is not None:
+            if self.detrend:
+                np.subtract(x, np.mean(x, axis=-1, keepdims=True), out=self.frame)
+            else:
+                self.frame[...] = x
+            if self.window is not None:
+                self.frame *= self.taper
+            x = self.frame
+        spectrum = rfft(x, axis=-1, workers=self.workers)[..., :N//2]
+        np.abs(spectrum, out=self.fft_values)
+        self.fft_values *= 2/N
+        np.square(self.fft_values, out=self.ps_values)
+        self.ps_values /= N
+        return self.fft_values, self.ps_values
+
+    # Returns (MNF, MDF, FD), each with one value per window.
+    def features(self, x):
+        N = np.shape(x)[-1]
+        f, P = self.power(x)
+        total = np.sum(P, axis=-1)
+        MNF = total/N
+        MDF = np.sum(P*f, axis=-1)/total
+        FD = np.sqrt(np.sum(P*((f-MDF[..., np.newaxis])**2), axis=-1)/total)
+        return MNF, MDF, FD
+
+
+# Average the power spectra of consecutive frames to steady a live display.
+# 'welch' takes the mean of the last `frames` periodograms (Welch's method with
+# the frames as overlapping segments), 'exponential' weights the newest one by
+# alpha, None shows every frame as is. The averages live in preallocated arrays
+# that are returned directly, copy them if they must outlive the next update.
+class SpectrumAverage:
+    def __init__(self, spectrum, mode='exponential', alpha=0.25, frames=8):
+        self.spectrum = spectrum
+        self.mode = mode
+        self.alpha = alpha
+        self.frames = frames
+        self.reset()
+
+    def reset(self):
+        self.average = None
+        self.count = 0
+
+    def update(self, x):
+        _, P = self.spectrum.power(x)
+        if self.average is None or self.average.shape != P.shape:
+            self.average = np.zeros(P.shape)
+            self.history = np.zeros((self.frames,) + P.shape) if self.mode == 'welch' else None
+            self.count = 0
+        if self.mode == 'welch':
+            # Running sum over a ring of the last `frames` periodograms.
+            slot = self.history[self.count % self.frames]
+            self.average -= slot
+            slot[...] = P
+            self.average += slot
+            self.count += 1
+            return self.average / min(self.count, self.frames)
+        if self.mode == 'exponential' and self.count > 0:
+            self.average *= 1 - self.alpha
+            self.average += self.alpha * P
+        else:
+            self.average[...] = P
+        self.count += 1
+        return self.average
+
+
+# Spectrum reuses its buffers, so every thread gets its own.
+_local = threading.local()
 
-    P = ps_values
-    f = fft_values
- 
-    S = []
-    for i in range(N//2):
-        P1 = P[i]
-        f1 = fft_values[i]
-        s1 = P1*f1
-        S.append(s1)
-    S1 = np.sum(S)/np.sum(P)
 
-    return S1
+def _spectrum():
+    if not hasattr(_local, 'spectrum'):
+        _local.spectrum = Spectrum()
+    return _local.spectrum
+
+
+def get_MDF(x):
+    return _spectrum().features(x)[1]
 
 
 def get_MNF(x):
-    N = len(x)
-    f_s = 1000
-    f_values, fft_values, ps_values, ps_cor_values = get_fft_power_spectrum(x, N, f_s, 2)
-    P = ps_values
-    S2 = np.sum(P)/N 
-    return S2
+    return _spectrum().features(x)[0]
 
 
 def get_FD(x):
-    N = len(x)
-    f_s = 1000
-    f_values, fft_values, ps_values, ps_cor_values = get_fft_power_spectrum(x, N, f_s, 2)
-    P = ps_values
-    f = fft_values
-    S = []
-    for i in range(N//2):
-        P1 = P[i]
-        f1 = fft_values[i]
-        s1 = P1*f1
-        S.append(s1)
-    S1 = np.sum(S)/np.sum(P)
-    S = []
-    for i in range(N//2):
-        P1 = P[i]
-        f1 = fft_values[i]
-        s2 = P1*((f1-S1)**2)
-        S.append(s2)
-    S3 = np.sqrt(np.sum(S) / np.sum(P))
-    return S3
+    return _spectrum().features(x)[2]
+
+
+# Names of the values returned by get_feature, in order.
+feature_names = ['mav', 'rms', 'var', 'wl', 'sampen', 'zc', 'wamp', 'arc1', 'arc2', 'arc3', 'arc4', 'mnf', 'mdf', 'fd']
 
 
 #获取特征数组
 def get_feature(data):
+    return get_features(data)
 
-    mav = np.sqrt(sum(np.fabs(data))/len(data))       
 
-    rms = np.sqrt(sum([x ** 2 for x in data])/ len(data))
+# Compute the 14-value feature vector of every row in one pass.
+# A (N,) window gives a (14,) vector, a (C, N) block gives a (C, 14) matrix.
+def get_features(data):
+    data = np.asarray(data, dtype=float)
+    if data.ndim == 1:
+        return get_features(data[np.newaxis])[0]
+    n = data.shape[-1]
 
-    var = np.var(data)
+    with timed('feature.time_domain'):
+        mav = np.sqrt(np.sum(np.fabs(data), axis=-1)/n)
 
-    wl = sum(np.fabs(np.diff(data)))/len(data)
+        rms = np.sqrt(np.sum(data**2, axis=-1)/n)
 
-    sampen = sampEn(data,np.std(data),2,0.15)
-    
-    zc = get_zc(data)
+        var = np.var(data, axis=-1)
 
-    wamp = get_wamp(data)
+        wl = np.sum(np.fabs(np.diff(data, axis=-1)), axis=-1)/n
 
-    ARC = get_ARC4(data).tolist()
+    with timed('feature.sampen'):
+        sampen = np.array([sampEn(x,np.std(x),2,0.15) for x in data])
 
-    MNF = get_MNF(data)
+    with timed('feature.zc_wamp'):
+        zc = get_zc(data)
 
-    MDF = get_MDF(data)
+        wamp = get_wamp(data)
 
-    FD = get_FD(data)
-    feature = np.array([mav,rms,var,wl,sampen,zc,wamp,ARC[1],ARC[2],ARC[3],ARC[4],MNF,MDF,FD])
+    with timed('feature.arc'):
+        ARC = get_ARC4(data.T)
+
+    with timed('feature.spectral'):
+        MNF, MDF, FD = _spectrum().features(data)
+    feature = np.column_stack((mav,rms,var,wl,sampen,zc,wamp,ARC[1],ARC[2],ARC[3],ARC[4],MNF,MDF,FD))
 
     return feature
+
+
+def _crossings(prev, cur):
+    return np.count_nonzero((cur*prev<0)&(np.fabs(cur-prev)>0.0), axis=-1)
+
+
+# Keeps the features of the last `window` samples of a (C, k) sample stream.
+# MAV/RMS/VAR/WL/ZC/WAMP follow running sums that are only updated for the
+# samples entering and leaving the window. sampEn, ARC and the spectral
+# features cannot be updated that way, they are recomputed every `stride`
+# samples, when the running sums are also resynchronized to limit drift.
+class FeatureTracker:
+    def __init__(self, channels=2, window=1000, stride=100):
+        self.channels = channels
+        self.window = window
+        self.stride = stride
+        self.data = np.empty((channels, 0))
+        self.pending = 0
+
+    def update(self, samples):
+        samples = np.asarray(samples, dtype=float).reshape(self.channels, -1)
+        k = samples.shape[1]
+        if k == 0:
+            return
+        old = self.data
+        self.data = np.concatenate((old, samples), axis=1)[:, -self.window:]
+        if self.data.shape[1] < self.window:
+            return
+        if old.shape[1] == self.window and k < self.window:
+            self._slide(old, samples)
+            self.pending += k
+            if self.pending < self.stride:
+                return
+        self._refresh()
+
+    def _slide(self, old, samples):
+        k = samples.shape[1]
+        out = old[:, :k]
+        self.s_abs += np.sum(np.fabs(samples), axis=1)-np.sum(np.fabs(out), axis=1)
+        self.s_sq += np.sum(samples**2, axis=1)-np.sum(out**2, axis=1)
+        self.s_d += np.sum(samples-self.shift, axis=1)-np.sum(out-self.shift, axis=1)
+        self.s_d2 += np.sum((samples-self.shift)**2, axis=1)-np.sum((out-self.shift)**2, axis=1)
+
+        # Neighbour pairs (prev, cur) leaving and entering the window.
+        out_prev, out_cur = old[:, :k], old[:, 1:k+1]
+        in_prev, in_cur = np.concatenate((old[:, -1:], samples[:, :-1]), axis=1), samples
+        out_diff = np.fabs(out_cur-out_prev)
+        in_diff = np.fabs(in_cur-in_prev)
+        self.s_wl += np.sum(in_diff, axis=1)-np.sum(out_diff, axis=1)
+        self.zc += _crossings(in_prev, in_cur)-_crossings(out_prev, out_cur)
+        for c in range(self.channels):
+            diffs = self.diffs[c]
+            gone = np.sort(out_diff[c])
+            # Equal values sit next to each other, offset them by their rank.
+            rank = np.arange(k)-np.searchsorted(gone, gone, 'left')
+            diffs = np.delete(diffs, np.searchsorted(diffs, gone, 'left')+rank)
+            came = np.sort(in_diff[c])
+            self.diffs[c] = np.insert(diffs, np.searchsorted(diffs, came), came)
+
+    def _refresh(self):
+        data = self.data
+        self.shift = data[:, :1].copy()
+        self.s_abs = np.sum(np.fabs(data), axis=1)
+        self.s_sq = np.sum(data**2, axis=1)
+        self.s_d = np.sum(data-self.shift, axis=1)
+        self.s_d2 = np.sum((data-self.shift)**2, axis=1)
+        diff = np.fabs(np.diff(data, axis=1))
+        self.s_wl = np.sum(diff, axis=1)
+        self.zc = _crossings(data[:, :-1], data[:, 1:])
+        self.diffs = list(np.sort(diff, axis=1))
+
+        self.sampen = np.array([sampEn(x,np.std(x),2,0.15) for x in data])
+        self.ARC = get_ARC4(data.T)
+        self.spectral = _spectrum().features(data)
+        self.pending = 0
+
+    # (C, 14) features in get_features order, None until the window is full.
+    def features(self):
+        data = self.data
+        if data.shape[1] < self.window:
+            return None
+        n = self.window
+        mav = np.sqrt(self.s_abs/n)
+        rms = np.sqrt(self.s_sq/n)
+        var = self.s_d2/n-(self.s_d/n)**2
+        wl = self.s_wl/n
+        # The first sample is paired with the last one, like get_zc/get_wamp.
+        zc = (self.zc+_crossings(data[:, -1:], data[:, :1]))/n
+        thresh = 0.02*np.max(data, axis=1)
+        wamp = np.array([len(d)-np.searchsorted(d, t, 'right') for d, t in zip(self.diffs, thresh)])
+        wamp = (wamp+(np.fabs(data[:, 0]-data[:, -1])>thresh))/n
+        MNF, MDF, FD = self.spectral
+        ARC = self.ARC
+        return np.column_stack((mav,rms,var,wl,self.sampen,zc,wamp,ARC[1],ARC[2],ARC[3],ARC[4],MNF,MDF,FD))
@@ -0,0 +1,156 @@
+import asyncio
+from collections import deque
+import queue
+from threading import Thread
+
+import numpy as np
+
+import profiling
+
+
+# Bounded buffer between a producer and one consumer on an asyncio loop.
+# put never blocks the producer, when the consumer falls behind the policy
+# decides what is kept:
+#   'drop_oldest' drops the oldest item once maxsize items are waiting,
+#   'drop_newest' drops the new item instead,
+#   'latest' keeps only the newest item (e.g. a result label),
+#   'coalesce' merges the new item into the last waiting one with merge
+#   (e.g. mergeBlocks for signal blocks), so nothing waits twice.
+class Mailbox:
+    def __init__(self, maxsize=16, policy='drop_oldest', merge=None):
+        if policy == 'coalesce' and merge is None:
+            raise ValueError('The coalesce policy needs a merge function')
+        self.maxsize = maxsize
+        self.policy = policy
+        self.merge = merge
+        self.items = deque()
+        self.dropped = 0
+        self.closed = False
+        self.ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        if self.policy == 'coalesce' and len(self.items) > 0:
+            self.items[-1] = self.merge(self.items[-1], item)
+        elif self.policy == 'latest':
+            self.dropped += len(self.items)
+            self.items.clear()
+            self.items.append(item)
+        elif len(self.items) >= self.maxsize:
+            self.dropped += 1
+            if self.policy == 'drop_newest':
+                return
+            self.items.popleft()
+            self.items.append(item)
+        else:
+            self.items.append(item)
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    # Iterate over the items until the mailbox is closed and empty.
+    async def __aiter__(self):
+        while True:
+            while len(self.items) == 0:
+                if self.closed:
+                    return
+                self.ready.clear()
+                await self.ready.wait()
+            yield self.items.popleft()
+
+
+# Concatenate (channels, n) signal blocks, keeping the last `limit` samples.
+def mergeBlocks(limit):
+    return lambda a, b: np.concatenate((a, b), axis=1)[:, -limit:]
+
+
+# Hands every item of a source to all subscribed mailboxes. A slow consumer
+# only fills (and drops from) its own mailbox, the others keep up.
+class FanOut:
+    def __init__(self):
+        self.mailboxes = list()
+
+    def subscribe(self, maxsize=16, policy='drop_oldest', merge=None):
+        mailbox = Mailbox(maxsize, policy, merge)
+        self.mailboxes.append(mailbox)
+        return mailbox
+
+    def publish(self, item):
+        for mailbox in self.mailboxes:
+            mailbox.put(item)
+
+    def close(self):
+        for mailbox in self.mailboxes:
+            mailbox.close()
+
+    async def pump(self, source, transform=None):
+        try:
+            async for item in source:
+                self.publish(item if transform is None else transform(item))
+        finally:
+            self.close()
+
+
+# Blocks of a transport.RingReader until the ring is closed. The read sleeps
+# on the ring condition in an executor thread, the loop is free meanwhile.
+async def ringBlocks(reader, timeout=0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        block = await loop.run_in_executor(None, reader.read, timeout)
+        if block is None:
+            if reader.ring.closed:
+                return
+            continue
+        profiling.since('ring_transit', reader.written_at)
+        yield block
+
+
+# Items of a multiprocessing Queue until `stop` is received.
+async def queueItems(mp_queue, stop=None, timeout=0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            item = await loop.run_in_executor(None, mp_queue.get, True, timeout)
+        except queue.Empty:
+            continue
+        if item == stop:
+            return
+        yield item
+
+
+# Call handler with every item of a mailbox. Blocking handlers (e.g. the
+# recognition) run in an executor thread, so the sources keep filling the
+# mailboxes while they work.
+async def consume(mailbox, handler, blocking=False):
+    loop = asyncio.get_running_loop()
+    async for item in mailbox:
+        if blocking:
+            await loop.run_in_executor(None, handler, item)
+        else:
+            handler(item)
+
+
+# Run the coroutine next to the Qt event loop of app and return the exit code.
+# With qasync installed both share the Qt thread, otherwise the asyncio loop
+# runs in a background thread and must reach the widgets through Qt signals,
+# which are queued to the Qt thread.
+def runWithQt(app, coro):
+    try:
+        import qasync
+    except ImportError:
+        qasync = None
+    if qasync is None:
+        td = Thread(target=asyncio.run, args=(coro,))
+        td.daemon = True
+        td.start()
+        return app.exec()
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    with loop:
+        loop.create_task(coro)
+        loop.run_forever()
+    return 0
@@ -0,0 +1,194 @@
+import atexit
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+
+# Latency instrumentation of the acquisition-to-result pipeline.
+# Set SEMG_PROFILE to a path prefix to enable it, every process then writes
+# its histograms and counters to <prefix>.<process>.<pid>.json when it exits
+# (or when dump() is called), and `python profiling.py <files>` prints them.
+# When SEMG_PROFILE is not set every call below returns immediately, hot
+# paths can also test ENABLED themselves to skip taking timestamps.
+PROFILE_PATH = os.environ.get('SEMG_PROFILE', '')
+ENABLED = bool(PROFILE_PATH)
+
+# Histogram buckets grow by 2 ** (1 / 4) from 1 us, the last one also takes
+# everything above (about 50 s).
+_BUCKETS_PER_OCTAVE = 4
+_BUCKET_COUNT = 26 * _BUCKETS_PER_OCTAVE
+
+
+def now():
+    # perf_counter is system-wide, so timestamps compare across processes.
+    return time.perf_counter_ns()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        i = int(math.log2(us) * _BUCKETS_PER_OCTAVE) + 1 if us >= 1 else 0
+        self.counts[min(i, _BUCKET_COUNT - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    # Upper edge of the bucket holding the q-th quantile (0 ~ 1), in seconds.
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n > 0 and seen >= rank:
+                return min(2 ** (i / _BUCKETS_PER_OCTAVE) * 1e-6, self.max)
+        return self.max
+
+    def state(self):
+        return {'counts': self.counts, 'count': self.count, 'total': self.total,
+                'min': self.min if self.count > 0 else 0.0, 'max': self.max}
+
+    @staticmethod
+    def fromState(state):
+        histogram = Histogram()
+        histogram.counts = list(state['counts'])
+        histogram.count = state['count']
+        histogram.total = state['total']
+        histogram.min = state['min'] if state['count'] > 0 else math.inf
+        histogram.max = state['max']
+        return histogram
+
+
+_lock = threading.Lock()
+histograms = dict()
+counters = dict()
+
+
+# Add a duration in seconds to the histogram of a stage.
+def record(stage, seconds):
+    if not ENABLED:
+        return
+    with _lock:
+        if stage not in histograms:
+            histograms[stage] = Histogram()
+        histograms[stage].add(seconds)
+
+
+# Record the time since a now() timestamp.
+def since(stage, start_ns):
+    if ENABLED:
+        record(stage, (now() - start_ns) * 1e-9)
+
+
+def count(name, n=1):
+    if not ENABLED:
+        return
+    with _lock:
+        counters[name] = counters.get(name, 0) + n
+
+
+class _Timer:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = now()
+
+    def __exit__(self, *_):
+        since(self.stage, self.start)
+
+
+class _NullTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *_):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+# with timed('stage'): ... records the duration of the block.
+def timed(stage):
+    return _Timer(stage) if ENABLED else _null_timer
+
+
+def snapshot():
+    with _lock:
+        return {
+            'process': _processName(),
+            'pid': os.getpid(),
+            'histograms': {stage: h.state() for stage, h in histograms.items()},
+            'counters': dict(counters),
+        }
+
+
+def _processName():
+    import multiprocessing
+    return multiprocessing.current_process().name
+
+
+# Write the profile of this process, returns the file name or None if disabled.
+# Call it before os._exit, which skips the atexit handler.
+def dump():
+    if not ENABLED:
+        return None
+    path = f'{PROFILE_PATH}.{_processName()}.{os.getpid()}.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f, indent=1)
+    return path
+
+
+if ENABLED:
+    atexit.register(dump)
+
+
+def formatReport(profiles):
+    merged = dict()
+    totals = dict()
+    for profile in profiles:
+        for stage, state in profile['histograms'].items():
+            histogram = Histogram.fromState(state)
+            if stage in merged:
+                merged[stage].merge(histogram)
+            else:
+                merged[stage] = histogram
+        for name, n in profile['counters'].items():
+            totals[name] = totals.get(name, 0) + n
+    lines = [f'{"stage":<28} {"count":>8} {"mean":>9} {"p50":>9} {"p90":>9} {"p99":>9} {"max":>9}  (ms)']
+    for stage in sorted(merged):
+        h = merged[stage]
+        values = [h.total / h.count, h.quantile(0.5), h.quantile(0.9), h.quantile(0.99), h.max]
+        lines.append(f'{stage:<28} {h.count:>8d} ' + ' '.join(f'{v * 1e3:9.3f}' for v in values))
+    for name in sorted(totals):
+        lines.append(f'{name:<28} {totals[name]:>8d}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python profiling.py <profile.json>...')
+        sys.exit(1)
+    profiles = list()
+    for path in sys.argv[1:]:
+        with open(path, encoding='utf-8') as f:
+            profiles.append(json.load(f))
+    print(formatReport(profiles))
@@ -0,0 +1,66 @@
+import asyncio
+import os
+
+from engine import RecognitionEngine
+from pipeline import FanOut, consume, mergeBlocks, queueItems, ringBlocks
+import profiling
+from scheduler import RecognitionScheduler
+
+
+# The headless recognition process of the client. It imports no Qt module, so
+# a spawned recognition process (the default on Windows) starts without
+# loading PySide6. The settings come from the constants of Client.py.
+class RecognitionClient:
+
+    def __init__(self, signal_ring, notify_queue, callback_queue, model_path, channels,
+                 capacity=4000, stride=100, workers=1):
+        self.signal_reader = signal_ring.reader()
+        self.notify_queue = notify_queue
+        self.callback_queue = callback_queue
+        self.capacity = capacity
+        # Use scheduler.MajorityVote or scheduler.Hysteresis (e.g. Hysteresis(1, enter=0.8,
+        # leave=0.5) with a model that has predict_proba) as smoother to stabilize the results.
+        scheduler = RecognitionScheduler(stride, smoother=None)
+        self.engine = RecognitionEngine(model_path, channels, capacity=capacity,
+                                        callback=self.putResult, scheduler=scheduler, workers=workers)
+
+    def putResult(self, result_text):
+        # The engine publishes None when it stops.
+        if result_text is not None:
+            self.callback_queue.put((result_text, self.engine.acquired_at, profiling.now()))
+
+    def run(self):
+        try:
+            asyncio.run(self.pipeline())
+        except Exception as e:
+            print(f'Exception in run, {e}')
+
+    # Analyze every new block the Bluetooth client publishes. The blocks that
+    # arrive while a window is analyzed are merged, together with the
+    # acquisition time of the latest one, and analyzed next.
+    async def pipeline(self):
+        signals = FanOut()
+        merge = mergeBlocks(self.capacity)
+        pending = signals.subscribe(policy='coalesce', merge=lambda a, b: (merge(a[0], b[0]), b[1]))
+        await asyncio.gather(
+            signals.pump(ringBlocks(self.signal_reader), lambda block: (block, self.signal_reader.written_at)),
+            consume(pending, self.analyzeSignalBlock, blocking=True),
+            self.peekNotifyQueue(),
+        )
+        self.engine.close()
+
+    def analyzeSignalBlock(self, stamped_block):
+        signal_block, self.engine.acquired_at = stamped_block
+        self.engine.feed(signal_block)
+
+    async def peekNotifyQueue(self):
+        async for _ in queueItems(self.notify_queue, 'CLOSE'):
+            pass
+        profiling.dump()
+        os._exit(0) # Use this to terminate all threads.
+
+
+def recognitionProcess(signal_ring, notify_queue, callback_queue, **settings):
+    # Recognition runs headless, it needs no QApplication.
+    rg_clnt = RecognitionClient(signal_ring, notify_queue, callback_queue, **settings)
+    rg_clnt.run()
@@ -0,0 +1,100 @@
+import os
+import struct
+from threading import Event, Lock, Thread
+import time
+
+import numpy as np
+
+
+# Binary recording layout: a 64-byte header followed by interleaved frames of
+# `channels` samples, so the data part can be memory-mapped as (n, channels).
+MAGIC = b'SEMGREC\0'
+VERSION = 1
+HEADER_FORMAT = '<8sHH4sdd' # magic, version, channels, dtype, sample rate, start time
+HEADER_SIZE = 64
+
+
+# Streams (channels, n) signal blocks into a binary recording as they arrive.
+# Data is flushed to disk every `flush_interval` seconds, so a crash loses at
+# most that much, and closing the recorder only writes the last buffered part.
+# The flush and fsync run on a thread of the recorder, write only buffers the
+# block and never waits for the disk.
+class Recorder:
+    def __init__(self, path, channels, sample_rate, dtype=np.float32, flush_interval=1.0, start_time=None):
+        self.channels = channels
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.flush_interval = flush_interval
+        self.start_time = time.time() if start_time is None else start_time
+        self.sample_count = 0
+        self.file = open(path, 'wb')
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, channels,
+                             self.dtype.str.encode('ascii'), sample_rate, self.start_time)
+        self.file.write(header.ljust(HEADER_SIZE, b'\0'))
+        self.lock = Lock()
+        self.stopped = Event()
+        self.flush()
+        self.flusher = Thread(target=Recorder.flushPeriodically, args=(self,))
+        self.flusher.daemon = True
+        self.flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def write(self, block):
+        block = np.asarray(block).reshape(self.channels, -1)
+        data = np.ascontiguousarray(block.T, dtype=self.dtype).tobytes()
+        with self.lock:
+            self.file.write(data)
+            self.sample_count += block.shape[1]
+
+    # Hand the buffered data to the OS under the lock, but wait for the disk
+    # outside of it, so write can go on meanwhile.
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def flushPeriodically(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.stopped.set()
+            self.flusher.join()
+            self.flush()
+            with self.lock:
+                self.file.close()
+
+
+def readHeader(path):
+    with open(path, 'rb') as f:
+        magic, version, channels, dtype, sample_rate, start_time = \
+            struct.unpack(HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT)))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{path} is not a version {VERSION} sEMG recording')
+    return {
+        'channels': channels,
+        'dtype': np.dtype(dtype.rstrip(b'\0').decode('ascii')),
+        'sample_rate': sample_rate,
+        'start_time': start_time,
+    }
+
+
+# Memory-map a recording, returns its header and a read-only (n, channels)
+# array. A trailing incomplete frame (e.g. after a crash) is ignored.
+def openRecording(path):
+    header = readHeader(path)
+    frame_size = header['channels'] * header['dtype'].itemsize
+    frame_count = (os.path.getsize(path) - HEADER_SIZE) // frame_size
+    if frame_count == 0:
+        return header, np.empty((0, header['channels']), header['dtype'])
+    data = np.memmap(path, header['dtype'], 'r', HEADER_SIZE, (frame_count, header['channels']))
+    return header, data
@@ -0,0 +1,34 @@
+import numpy as np
+
+
+# Reduce y (sampled at x) to at most `columns` pixel columns. Every column
+# keeps the minimum and the maximum of its samples, drawn as a vertical line
+# at the first x of the column, so spikes stay visible after decimation.
+# Returns the (x, y) arrays unchanged if there are less than 2 samples per column.
+def decimateMinMax(x, y, columns):
+    n = len(y)
+    if columns <= 0 or n < 2 * columns:
+        return x, y
+    starts = np.linspace(0, n, columns, endpoint=False).astype(np.intp)
+    points = np.empty((2, columns), np.float64)
+    np.minimum.reduceat(y, starts, out=points[0])
+    np.maximum.reduceat(y, starts, out=points[1])
+    return np.repeat(x[starts], 2), points.T.ravel()
+
+
+# Replace all points of a QXYSeries with the (x, y) arrays. PySide6 fills the
+# point buffer from NumPy arrays directly with replaceNp; older bindings need
+# a list of QPointF.
+def fillSeries(series, x, y):
+    x = np.ascontiguousarray(x, np.float64)
+    y = np.ascontiguousarray(y, np.float64)
+    if hasattr(series, 'replaceNp'):
+        series.replaceNp(x, y)
+    else:
+        from PySide6.QtCore import QPointF
+        series.replace([QPointF(a, b) for a, b in zip(x.tolist(), y.tolist())])
+
+
+# Pixel columns available to the series of a chart, at least 1.
+def plotColumns(chart):
+    return max(1, int(chart.plotArea().width()))
@@ -0,0 +1,81 @@
+from collections import Counter, deque
+
+
+# Decides when the recognition engine classifies and smooths its results.
+# A window is classified once at least `stride` new samples arrived since the
+# previous one, so the classification rate is bounded by the sampling rate
+# divided by the stride. When classifying falls behind, only the latest window
+# is classified and the windows in between are dropped (counted in skipped).
+class RecognitionScheduler:
+    def __init__(self, stride=100, smoother=None):
+        self.stride = stride
+        self.smoother = smoother
+        self.last_index = None
+        self.skipped = 0
+
+    def due(self, total):
+        return self.last_index is None or total - self.last_index >= self.stride
+
+    # Mark the window ending at absolute sample index total as classified.
+    def start(self, total):
+        if self.last_index is not None:
+            self.skipped += max(0, (total - self.last_index) // self.stride - 1)
+        self.last_index = total
+
+    # Whether smooth needs the gesture probabilities of the model.
+    @property
+    def uses_probabilities(self):
+        return getattr(self.smoother, 'uses_probabilities', False)
+
+    # Returns the result to publish, or None if nothing should be published.
+    # probabilities maps every gesture to the model's probability, or is None.
+    def smooth(self, result, probabilities=None):
+        return result if self.smoother is None else self.smoother.update(result, probabilities)
+
+
+# Publish the most frequent of the last `size` results. Ties go to the
+# result that entered the history first.
+class MajorityVote:
+    def __init__(self, size=4, initial='静息'):
+        self.history = deque([initial] * size, maxlen=size)
+
+    def update(self, result, probabilities=None):
+        self.history.append(result)
+        return Counter(self.history).most_common(1)[0][0]
+
+
+# Only switch to a new result after it was seen `count` times in a row, and
+# keep publishing the current result until then (None before the first one).
+# With enter and leave (enter > leave) the probabilities of the model add a
+# confidence hysteresis: the current result is kept while its probability
+# stays at or above `leave`, and a new result only counts towards the switch
+# when its probability is at least `enter`. Models without predict_proba
+# (e.g. the compiled .npz ones) give no probabilities, then only the count
+# applies.
+class Hysteresis:
+    def __init__(self, count=2, enter=None, leave=None):
+        self.count = count
+        self.enter = enter
+        self.leave = leave
+        self.uses_probabilities = enter is not None or leave is not None
+        self.current = None
+        self.candidate = None
+        self.run = 0
+
+    def update(self, result, probabilities=None):
+        if probabilities is not None:
+            if self.leave is not None and self.current is not None \
+                    and probabilities.get(self.current, 0.0) >= self.leave:
+                self.candidate = None
+                self.run = 0
+                return self.current
+            if self.enter is not None and probabilities.get(result, 0.0) < self.enter:
+                return self.current
+        if result == self.candidate:
+            self.run += 1
+        else:
+            self.candidate = result
+            self.run = 1
+        if self.run >= self.count:
+            self.current = self.candidate
+        return self.current
@@ -0,0 +1,230 @@
+import argparse
+from multiprocessing import Process, Queue
+import select
+import socket
+import sys
+from threading import Thread
+import time
+
+import numpy as np
+
+from dataset import Recording, findRecordings
+from decoder import SampleDecoder
+from transport import SharedRing
+
+
+# Stand-in for the KL25Z board of server.c, so the client pipeline can be
+# driven without Bluetooth. It listens on a local TCP socket and speaks the
+# same protocol: 0x01 starts sampling, 0x02 stops it, and every sample is
+# sent as one frame of little-endian uint16 values, one per channel.
+START_SAMPLING = b'\x01'
+STOP_SAMPLING = b'\x02'
+VREF = 3.3
+
+
+# Deterministic synthetic sEMG as the device sends it: band-limited noise
+# (20 ~ 450 Hz) whose amplitude rises in random contraction bursts, around the
+# 1.65 V offset and quantized to the 16-bit ADC steps.
+def syntheticSemg(channels=2, length=1000, f_s=1000, seed=0):
+    from scipy.signal import butter, sosfilt
+    rng = np.random.default_rng(seed)
+    sos = butter(4, (20, min(450, f_s * 0.45)), 'bandpass', fs=f_s, output='sos')
+    noise = sosfilt(sos, rng.standard_normal((channels, length + f_s)), axis=-1)[:, f_s:]
+    noise /= np.std(noise, axis=-1, keepdims=True)
+    envelope = np.full((channels, length), 0.02)
+    t = np.arange(length)
+    for c in range(channels):
+        start = int(rng.integers(0, f_s // 2))
+        while start < length:
+            duration = int(rng.integers(f_s * 15 // 100, f_s * 40 // 100))
+            # Raised-cosine burst, so the amplitude changes smoothly.
+            phase = np.clip((t - start) / duration, 0, 1)
+            envelope[c] += rng.uniform(0.1, 0.4) * (1 - np.cos(2 * np.pi * phase)) / 2
+            start += duration + int(rng.integers(f_s // 5, f_s * 6 // 10))
+    signal = np.clip(1.65 + envelope * noise, 0, VREF * 65535 / 65536)
+    return np.floor(signal / VREF * 65536) * (VREF / 65536)
+
+
+# Inverse of decoder.SampleDecoder: (channels, n) voltages to the byte stream.
+def encodeSamples(block, vref=VREF):
+    raw = np.clip(np.floor(np.asarray(block) / vref * 65536), 0, 65535).astype('<u2')
+    return np.ascontiguousarray(raw.T).tobytes()
+
+
+# Sources hand out the (channels, n) voltages to send next, endlessly.
+class LoopSource:
+    def __init__(self, signal):
+        self.signal = np.asarray(signal)
+        self.pos = 0
+
+    @property
+    def channels(self):
+        return self.signal.shape[0]
+
+    def read(self, n):
+        length = self.signal.shape[1]
+        index = (self.pos + np.arange(n)) % length
+        self.pos = (self.pos + n) % length
+        return self.signal[:, index]
+
+
+# 10 s of syntheticSemg, repeated.
+def syntheticSource(channels=2, sample_rate=1000, seed=0, seconds=10):
+    return LoopSource(syntheticSemg(channels, int(seconds * sample_rate), sample_rate, seed))
+
+
+# An exported recording (see dataset.findRecordings), repeated.
+def replaySource(path):
+    matches = [rec for rec in findRecordings() if rec.name == path]
+    rec = matches[0] if len(matches) > 0 else Recording(path, [path])
+    return LoopSource(np.asarray(rec.window(0, len(rec))))
+
+
+class SimulatedDevice:
+    # speed is the multiple of real time to send at, 0 sends as fast as the
+    # socket takes the data.
+    def __init__(self, source, sample_rate=1000, speed=1.0, host='127.0.0.1', port=0, interval=0.005):
+        self.source = source
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.interval = interval
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()
+        self.sent = 0
+
+    def serveForever(self):
+        while True:
+            conn, _ = self.server.accept()
+            with conn:
+                self.serve(conn)
+
+    def start(self):
+        td = Thread(target=SimulatedDevice.serveForever, args=(self,))
+        td.daemon = True
+        td.start()
+        return self.address
+
+    # Handle one connection until the client disconnects.
+    def serve(self, conn):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sampling = False
+        start, sent = 0, 0
+        while True:
+            readable, _, _ = select.select([conn], [], [], 0 if sampling else None)
+            if readable:
+                command = conn.recv(64)
+                if not command:
+                    return
+                # Like the board, the last command received wins.
+                for byte in command:
+                    if byte == START_SAMPLING[0] and not sampling:
+                        sampling = True
+                        start, sent = time.perf_counter(), 0
+                    elif byte == STOP_SAMPLING[0]:
+                        sampling = False
+            if not sampling:
+                continue
+            if self.speed > 0:
+                due = int((time.perf_counter() - start) * self.sample_rate * self.speed)
+            else:
+                due = sent + max(1, int(self.sample_rate * self.interval))
+            if due <= sent:
+                time.sleep(self.interval)
+                continue
+            try:
+                conn.sendall(encodeSamples(self.source.read(due - sent)))
+            except OSError:
+                return
+            self.sent += due - sent
+            sent = due
+
+    def close(self):
+        self.server.close()
+
+
+def recognize(reader, model_path, channels, window, stride, results):
+    from engine import RecognitionEngine
+    from scheduler import RecognitionScheduler
+    published = list()
+    engine = RecognitionEngine(model_path, channels, window, capacity=4 * window,
+                               callback=published.append, scheduler=RecognitionScheduler(stride))
+    engine.ready.wait()
+    try:
+        engine.run(reader)
+        error = None
+    except Exception as e:
+        error = repr(e)
+    # The engine publishes None when it stops.
+    results.put({'results': len([r for r in published if r is not None]), 'skipped windows': engine.scheduler.skipped,
+                 'dropped': reader.dropped, 'error': error})
+
+
+# Connect like the Bluetooth client does, decode and publish into a shared
+# ring for `seconds`, and report the sustained rate. With a model, a
+# recognition process consumes the ring as in the client.
+def loadTest(device, channels, seconds, model_path='', window=1000, stride=100, read_size=65536):
+    ring = SharedRing(channels, max(10 * window, device.sample_rate * 10))
+    results = Queue()
+    consumer = None
+    if model_path:
+        consumer = Process(target=recognize, args=(ring.reader(), model_path, channels, window, stride, results))
+        consumer.start()
+        time.sleep(1)
+    decoder = SampleDecoder(channels)
+    received = 0
+    with socket.create_connection(device.address) as conn:
+        conn.sendall(START_SAMPLING)
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            block = decoder.decode(conn.recv(read_size))
+            if block.shape[1] > 0:
+                ring.write(block)
+                received += block.shape[1]
+        elapsed = time.perf_counter() - start
+        conn.sendall(STOP_SAMPLING)
+    ring.close()
+    report = {'target': device.sample_rate * device.speed, 'received': received / elapsed,
+              'behind': max(0, device.sent - received)}
+    if consumer is not None:
+        report.update(results.get())
+        consumer.join()
+    ring.unlink()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulated sEMG board speaking the server.c protocol over TCP.')
+    parser.add_argument('command', choices=('serve', 'loadtest'),
+                        help='serve clients (run the client with SEMG_DEVICE=host:port), or measure the sustained rate')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--rate', type=int, default=1000, help='samples per second and channel')
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--speed', type=float, default=1.0, help='multiple of real time, 0 for as fast as possible')
+    parser.add_argument('--replay', help='recording to replay, e.g. complete/<time> or a .semg file, default synthetic')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of the load test')
+    parser.add_argument('--model', default='', help='model to recognize with in the load test')
+    args = parser.parse_args(argv)
+
+    source = replaySource(args.replay) if args.replay else syntheticSource(args.channels, args.rate)
+    if source.channels != args.channels:
+        parser.error(f'the recording has {source.channels} channels')
+    device = SimulatedDevice(source, args.rate, args.speed, args.host,
+                             args.port if args.command == 'serve' else 0)
+    if args.command == 'serve':
+        print(f'Simulated device listening on {device.address[0]}:{device.address[1]}')
+        try:
+            device.serveForever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    device.start()
+    report = loadTest(device, args.channels, args.seconds, args.model)
+    for key, value in report.items():
+        print(f'{key:<12} {value}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+from multiprocessing import Condition, shared_memory
+import time
+
+import numpy as np
+
+
+# Header slots (int64) at the start of the shared memory block.
+_COMMITTED = 0 # Samples completely written and visible to readers.
+_RESERVED = 1 # Samples the writer has started to write.
+_CLOSED = 2
+_WRITTEN_AT = 3 # time.perf_counter_ns() of the latest block, for latency measurements.
+_HEADER_SIZE = 64
+
+
+# Single-producer / multi-consumer signal ring in shared memory.
+# The Bluetooth process writes (channels, n) blocks once, every consumer
+# process copies the new samples out through its own RingReader cursor and
+# sleeps on a condition until the writer publishes more. Nothing is pickled
+# per block and a slow consumer only loses its own oldest samples.
+class SharedRing:
+    def __init__(self, channels, capacity, dtype=np.float32):
+        self.channels = channels
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        size = _HEADER_SIZE + channels * capacity * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.cond = Condition()
+        self.attach()
+        self.header[:] = 0
+
+    def attach(self):
+        self.header = np.ndarray((_HEADER_SIZE // 8,), np.int64, self.shm.buf)
+        self.data = np.ndarray((self.channels, self.capacity), self.dtype, self.shm.buf, _HEADER_SIZE)
+
+    # Only the name of the shared memory travels to the spawned processes.
+    def __getstate__(self):
+        return (self.shm.name, self.channels, self.capacity, self.dtype, self.cond)
+
+    def __setstate__(self, state):
+        name, self.channels, self.capacity, self.dtype, self.cond = state
+        # Child processes share the resource tracker of the creating process,
+        # which owns the block and unlinks it.
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.attach()
+
+    @property
+    def count(self):
+        return int(self.header[_COMMITTED])
+
+    @property
+    def closed(self):
+        return bool(self.header[_CLOSED])
+
+    # timestamp (perf_counter_ns) is when the block was acquired, default now.
+    def write(self, block, timestamp=None):
+        block = np.asarray(block).reshape(self.channels, -1)
+        n = block.shape[1]
+        count = int(self.header[_COMMITTED])
+        self.header[_RESERVED] = count + n
+        if n > self.capacity:
+            block = block[:, -self.capacity:]
+        pos = (count + n - block.shape[1]) % self.capacity
+        head = min(block.shape[1], self.capacity - pos)
+        self.data[:, pos:pos + head] = block[:, :head]
+        self.data[:, 0:block.shape[1] - head] = block[:, head:]
+        with self.cond:
+            self.header[_WRITTEN_AT] = time.perf_counter_ns() if timestamp is None else timestamp
+            self.header[_COMMITTED] = count + n
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.header[_CLOSED] = 1
+            self.cond.notify_all()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def reader(self):
+        return RingReader(self)
+
+
+class RingReader:
+    def __init__(self, ring):
+        self.ring = ring
+        # Start with the samples written after the reader was created.
+        self.cursor = ring.count
+        # Samples this reader lost because the writer lapped it.
+        self.dropped = 0
+        # Acquisition timestamp of the latest block returned by read.
+        self.written_at = 0
+
+    # Block until new samples are committed and return them as a (channels, n)
+    # copy. Returns None on timeout or when the ring is closed.
+    def read(self, timeout=None):
+        ring = self.ring
+        with ring.cond:
+            if not ring.cond.wait_for(lambda: ring.count > self.cursor or ring.closed, timeout):
+                return None
+            count = ring.count
+            self.written_at = int(ring.header[_WRITTEN_AT])
+        if count <= self.cursor:
+            return None
+        start = max(self.cursor, count - ring.capacity)
+        n = count - start
+        pos = start % ring.capacity
+        head = min(n, ring.capacity - pos)
+        block = np.concatenate((ring.data[:, pos:pos + head], ring.data[:, 0:n - head]), axis=1)
+        # Drop the samples the writer may have overwritten while they were copied.
+        torn = min(int(ring.header[_RESERVED]) - ring.capacity - start, n)
+        if torn > 0:
+            block = block[:, torn:]
+            start += torn
+        self.dropped += start - self.cursor
+        self.cursor = count
+        return block
@@ -27,6 +27,11 @@ void StopPit(int channel);
 #define ADC_CHANNEL_5_INPUT (0x09) // ADC0_SE9
 #define ADC_CHANNEL_6_INPUT (0x08) // ADC0_SE8
 
+// Channels sent in every frame (1 ~ 6), must match CHANNEL_COUNT in Client.py.
+// Each sample takes 2 bytes, so CHANNEL_COUNT * 2 * TIMER_FREQ must stay
+// below UART_BAUD_RATE / 10 bytes per second.
+#define CHANNEL_COUNT (2)
+
 void InitAdc(void);
 
 // 4-0 ADCH: AD Input channel selection.
@@ -109,7 +114,21 @@ void PIT_IRQHandler(void)
         
         // User defined works.
         SEND_CHANNEL_DATA(1);
+#if CHANNEL_COUNT >= 2
         SEND_CHANNEL_DATA(2);
+#endif
+#if CHANNEL_COUNT >= 3
+        SEND_CHANNEL_DATA(3);
+#endif
+#if CHANNEL_COUNT >= 4
+        SEND_CHANNEL_DATA(4);
+#endif
+#if CHANNEL_COUNT >= 5
+        SEND_CHANNEL_DATA(5);
+#endif
+#if CHANNEL_COUNT >= 6
+        SEND_CHANNEL_DATA(6);
+#endif
     }
 }
 